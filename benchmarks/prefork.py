@@ -0,0 +1,200 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Load test of the pre-forking server.
+
+Starts ``WORKERS`` workers forked from a warm master, then ``WORKERS`` independent processes
+each importing and warming the application itself, and compares their startup time, their
+memory (RSS and PSS summed over all the processes, Linux only) and their throughput.
+
+Usage: python benchmarks/prefork.py [-w WORKERS] [-n REQUESTS] [-c CONCURRENCY] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess  # noqa: S404
+import http.client
+
+PORT = 18080
+
+
+def serve(port, nb_workers, reuse_port):
+    import webob
+
+    from nagare.server import mvc_prefork
+    from nagare.renderers import html5_base
+    from nagare.services import presentation
+
+    class App:
+        def create_renderer(self, **params):
+            return html5_base.Renderer(static_url='/static')
+
+        def render_skeleton(self, h):
+            return h.html(lang='en')
+
+    class Chain:
+        def next(self, renderer, response, **params):
+            h = renderer
+            h.head << h.head.title('Benchmark')
+            h << h.h1('Benchmark') << h.ul([h.li(h.a('Item %d' % i, href='/items/%d' % i)) for i in range(100)])
+
+            return response
+
+    app = App()
+    p = presentation.PresentationService(None, None, False, skeleton=True)
+
+    def handle(request, response):
+        response = p.handle_request(Chain(), app, request, response)
+        response.headers['X-Pid'] = str(os.getpid())
+
+        return response
+
+    def warmup():
+        p.handle_start(app)
+        print('ready', flush=True)
+
+    mvc_prefork.PreforkServer(
+        mvc_prefork.create_wsgi_app(handle, webob.Request, webob.Response),
+        port=port,
+        nb_workers=nb_workers,
+        warmup=warmup,
+        reuse_port=reuse_port,
+    ).serve()
+
+
+def start(nb_workers, nb_processes):
+    """Start the servers then wait for their ``ready`` message.
+
+    Returns:
+        the processes and the startup time, in seconds
+    """
+    command = [sys.executable, __file__, '--serve', '--port', str(PORT), '-w', str(nb_workers)]
+    if nb_processes > 1:
+        command.append('--reuse-port')
+
+    started = time.perf_counter()
+    processes = [
+        subprocess.Popen(command, stdout=subprocess.PIPE, text=True)  # noqa: S603
+        for _ in range(nb_processes)
+    ]
+    for process in processes:
+        process.stdout.readline()
+
+    return processes, time.perf_counter() - started
+
+
+def get_pids(processes):
+    pids = []
+    for process in processes:
+        pids.append(process.pid)
+        try:
+            with open('/proc/{0}/task/{0}/children'.format(process.pid)) as f:
+                pids.extend(int(pid) for pid in f.read().split())
+        except OSError:
+            pass
+
+    return pids
+
+
+def measure_memory(pids):
+    """RSS and PSS, in KB, summed over all the processes."""
+    memory = {'rss_kb': 0, 'pss_kb': 0}
+    for pid in pids:
+        try:
+            with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+                for line in f:
+                    name, value = line.split(':', 1)
+                    if name in ('Rss', 'Pss'):
+                        memory[name.lower() + '_kb'] += int(value.split()[0])
+        except OSError:
+            return None
+
+    return memory
+
+
+def load(nb_requests, concurrency):
+    """Send ``nb_requests`` requests from ``concurrency`` threads.
+
+    Returns:
+        the number of requests per second and the number of processes that answered
+    """
+    pids = set()
+
+    def send(nb):
+        for _ in range(nb):
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+            connection.request('GET', '/bench')
+            response = connection.getresponse()
+            response.read()
+            pids.add(response.getheader('X-Pid'))
+            connection.close()
+
+    threads = [threading.Thread(target=send, args=(nb_requests // concurrency,)) for _ in range(concurrency)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return (nb_requests // concurrency) * concurrency / (time.perf_counter() - started), len(pids)
+
+
+def run(mode, nb_workers, nb_requests, concurrency):
+    processes, startup = start(nb_workers, 1) if mode == 'prefork' else start(0, nb_workers)
+    try:
+        load(concurrency, concurrency)  # Warm up
+        requests_per_second, nb_pids = load(nb_requests, concurrency)
+
+        return dict(
+            {'startup_ms': startup * 1000, 'requests_per_second': requests_per_second, 'processes': nb_pids},
+            **(measure_memory(get_pids(processes)) or {}),
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of workers')
+    parser.add_argument('-n', '--requests', type=int, default=2000, help='number of requests per mode')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--json', action='store_true', help='JSON output')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=PORT, help=argparse.SUPPRESS)
+    parser.add_argument('--reuse-port', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port, args.workers, args.reuse_port)
+        return
+
+    results = {}
+    for mode in ('prefork', 'independent'):
+        results[mode] = result = run(mode, args.workers, args.requests, args.concurrency)
+
+        if not args.json:
+            print(
+                '{:12} startup {startup_ms:8.1f} ms  {requests_per_second:8.1f} req/s  {processes} processes  '
+                'RSS {rss_kb:8} KB  PSS {pss_kb:8} KB'.format(mode, **dict({'rss_kb': '-', 'pss_kb': '-'}, **result))
+            )
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
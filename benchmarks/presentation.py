@@ -0,0 +1,191 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Benchmarks of the presentation pipeline.
+
+Each scenario renders a synthetic page of ``size`` items nested ``depth`` levels deep,
+as a full page or a XHR response, generic or through the XHR fast path, from the renderer
+tree, a list or a generator, with or without doctype, and reports the throughput, the latency
+percentiles and the peak of the Python allocations per request (the libxml2 allocations are
+not traced). The ``serialize`` and ``serialize_minified`` scenarios compare the serialization of
+a page without and with its minification. The ``create_renderer`` and ``acquire_renderer`` scenarios
+compare the creation of a renderer with its reuse from a ``RendererPool``.
+
+Usage: python benchmarks/presentation.py [-n REQUESTS] [-k FILTER] [--json]
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import statistics
+import tracemalloc
+
+import webob
+
+from nagare.renderers import html5_base
+from nagare.services import presentation
+from nagare.server import mvc_application
+
+SIZES = (10, 100, 1000)
+DEPTHS = (1, 8)
+PATHS = ('full', 'xhr', 'xhr_fast_path')
+OUTPUTS = ('tree', 'list', 'generator')
+DOCTYPES = ('doctype', 'no_doctype')
+
+
+class NoDoctypeRenderer(html5_base.Renderer):
+    doctype = ''
+
+
+class App:
+    def __init__(self, doctype):
+        self.renderer_factory = html5_base.Renderer if doctype else NoDoctypeRenderer
+
+    def create_renderer(self, **params):
+        return self.renderer_factory(static_url='/static')
+
+    def create_xhr_renderer(self, **params):
+        return mvc_application.XHRRenderer(static_url='/static')
+
+
+class Chain:
+    def __init__(self, view):
+        self.view = view
+
+    def next(self, renderer, response, **params):
+        self.view(renderer)
+        return response
+
+
+def create_items(h, size, depth):
+    for i in range(size):
+        item = h.li(h.a('Item %d' % i, href='/items/%d' % i), class_='item')
+        for _ in range(depth - 1):
+            item = h.div(item)
+
+        yield item
+
+
+def create_page(h, size, depth):
+    h.head << h.head.title('Benchmark')
+    h.head.javascript_url('/foo.js')
+
+    h << h.h1('Benchmark') << h.ul(create_items(h, size, depth))
+
+
+def create_request(path):
+    headers = {'X-Requested-With': 'XMLHttpRequest'} if path.startswith('xhr') else {}
+    return webob.Request.blank('/bench', headers=headers)
+
+
+def create_scenarios(size, depth, path, output, doctype):
+    p = presentation.PresentationService(None, None, True, xhr_fast_path=path == 'xhr_fast_path')
+    app = App(doctype == 'doctype')
+
+    if output == 'tree':
+        chain, render = Chain(lambda h: create_page(h, size, depth)), None
+    elif output == 'list':
+        chain, render = Chain(lambda h: None), lambda h: list(create_items(h, size, depth))
+    else:
+        chain, render = Chain(lambda h: None), lambda h: create_items(h, size, depth)
+
+    def handle_request():
+        return p.handle_request(chain, app, create_request(path), webob.Response(), render)
+
+    scenarios = {'handle_request': handle_request}
+
+    if (path, output) == ('full', 'tree'):
+
+        def merge_head():
+            h = app.create_renderer()
+            create_page(h, size, depth)
+            return p.merge_head(create_request(path), h, h.head.render_top(), h.head.render_bottom(), h.root)
+
+        page, minified_page = merge_head(), merge_head()
+        doctype = app.create_renderer().doctype
+
+        scenarios['merge_head'] = merge_head
+        scenarios['serialize'] = lambda: p.serialize(page, 'utf-8', doctype)
+        scenarios['serialize_minified'] = lambda: p.serialize(p.minify_tree(minified_page), 'utf-8', doctype)
+
+        pool = mvc_application.RendererPool(app.renderer_factory, 1)
+
+        scenarios['create_renderer'] = app.create_renderer
+        scenarios['acquire_renderer'] = lambda: pool.release(pool.acquire(static_url='/static'))
+
+    return scenarios
+
+
+def measure(func, nb):
+    latencies = []
+    for _ in range(nb):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def measure_allocations(func, nb):
+    peaks = []
+
+    tracemalloc.start()
+    for _ in range(nb):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return statistics.median(peaks)
+
+
+def run(func, nb):
+    measure(func, max(1, nb // 10))  # Warm up
+
+    latencies = measure(func, nb)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+
+    return {
+        'requests_per_second': len(latencies) / sum(latencies),
+        'p50_ms': percentiles[49] * 1000,
+        'p90_ms': percentiles[89] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'allocated_kb': measure_allocations(func, max(1, nb // 10)) / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--requests', type=int, default=100, help='number of requests per scenario')
+    parser.add_argument('-k', '--filter', default='', help='only run the scenarios containing this string')
+    parser.add_argument('--json', action='store_true', help='JSON output')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for params in itertools.product(SIZES, DEPTHS, PATHS, OUTPUTS, DOCTYPES):
+        for target, func in create_scenarios(*params).items():
+            name = '{}[size={},depth={},{},{},{}]'.format(target, *params)
+            if args.filter in name:
+                results[name] = result = run(func, args.requests)
+
+                if not args.json:
+                    print(
+                        '{:70} {requests_per_second:10.1f} req/s  p50 {p50_ms:8.3f} ms  p90 {p90_ms:8.3f} ms  '
+                        'p99 {p99_ms:8.3f} ms  {allocated_kb:10.1f} KB'.format(name, **result)
+                    )
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
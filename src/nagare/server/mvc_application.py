@@ -7,24 +7,165 @@
 # this distribution.
 # --
 
+import weakref
+import threading
+
 from nagare.renderers import html5_base
 from nagare.server.http_application import Request, RESTApp, Response  # noqa: F401
 
 # ---------------------------------------------------------------------------
 
 
+class NullHeadRenderer:
+    """Head renderer ignoring all the declarations."""
+
+    def __init__(self, *args, **params):
+        pass
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kw):
+        return self
+
+    def __lshift__(self, other):
+        return self
+
+
+class XHRRenderer(html5_base.Renderer):
+    """Renderer of the XHR responses, without head machinery."""
+
+    head_renderer_factory = NullHeadRenderer
+
+
+class RendererPool:
+    """Per thread pool of reusable renderers.
+
+    A renderer goes back to the pool of the thread that acquired it, even when it's released
+    by another thread, e.g. once serialized by a worker thread.
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self.local = threading.local()
+        self.acquired = weakref.WeakKeyDictionary()  # Pool of each acquired renderer
+
+    @property
+    def renderers(self):
+        renderers = getattr(self.local, 'renderers', None)
+        if renderers is None:
+            renderers = self.local.renderers = []
+
+        return renderers
+
+    def acquire(self, **params):
+        """Reset a pooled renderer or create a new one.
+
+        A renderer is reset by the ``reset(**params)`` method of its class if it has one. Else all
+        its attributes are dropped and its class initialisation is run again, so that no state of
+        the previous request, even nested, is kept.
+        """
+        renderers = self.renderers
+        if not renderers:
+            renderer = self.factory(**params)
+        else:
+            renderer = renderers.pop()
+
+            reset = getattr(type(renderer), 'reset', None)
+            if reset is not None:
+                reset(renderer, **params)
+            else:
+                vars(renderer).clear()
+                type(renderer).__init__(renderer, **params)
+
+        self.acquired[renderer] = renderers
+
+        return renderer
+
+    def release(self, renderer):
+        renderers = self.acquired.pop(renderer, None)
+        if (renderers is not None) and (len(renderers) < self.size):
+            renderers.append(renderer)
+
+
 class App(RESTApp):
     """Application to handle a HTTP request."""
 
-    CONFIG_SPEC = RESTApp.CONFIG_SPEC | {'default_content_type': 'string(default="text/html")'}
+    CONFIG_SPEC = RESTApp.CONFIG_SPEC | {
+        'default_content_type': 'string(default="text/html")',
+        'renderer_pool_size': 'integer(default=0)',
+    }
     renderer_factory = html5_base.Renderer
+    xhr_renderer_factory = XHRRenderer
+
+    def __init__(self, name, dist, renderer_pool_size=0, **config):
+        super().__init__(name, dist, renderer_pool_size=renderer_pool_size, **config)
+
+        self.renderers = RendererPool(self.renderer_factory, renderer_pool_size) if renderer_pool_size else None
 
     def create_renderer(self, **params):
         """Create the initial renderer."""
+        if self.renderers is not None:
+            return self.renderers.acquire(static_url=self.static_url)
+
         return self.renderer_factory(static_url=self.static_url)
 
+    def create_xhr_renderer(self, **params):
+        """Create the renderer of a XHR request, used by the XHR fast path of the presentation service."""
+        return self.xhr_renderer_factory(static_url=self.static_url)
+
+    def release_renderer(self, renderer):
+        """Give back a renderer once the response is fully serialized.
+
+        Only the renderers created by ``create_renderer()`` are pooled, not the XHR renderers.
+        """
+        if (self.renderers is not None) and (type(renderer) is self.renderer_factory):
+            self.renderers.release(renderer)
+
+    def render_skeleton(self, h):
+        """Declare the static parts shared by all the pages.
+
+        Called once when the ``skeleton`` option of the presentation service is on: the entries
+        declared on ``h.head`` and the attributes of the returned ``<html>`` element are then
+        serialized only once, not for each request.
+        """
+        return h.html
+
+    def get_version_key(self, request, **params):
+        """Cheap version of the response to ``request``, computed before any rendering.
+
+        When the ``etag`` option of the presentation service is on and a version is returned,
+        it is used as ETag and a matching ``If-None-Match`` request is answered ``304`` without
+        calling the views. It must change with everything the rendering depends on.
+        """
+        return None
+
+    def get_preload_key(self, request, **params):
+        """Key of the view rendering ``request``, computed before any rendering.
+
+        When the ``preload`` option of the presentation service is on, the preload links extracted
+        from the head renderer are cached under this key and sent as ``103 Early Hints`` to the next
+        requests with the same key, when served by the ASGI adapter. Return ``None`` to extract them
+        for each request.
+        """
+        return request.path_info
+
     def create_dispatch_args(self, renderer, **params):
         return super().create_dispatch_args(**params) + (renderer,)
 
     def set_response_body(self, response, body):
         return response
+
+
+class AsyncApp(App):
+    """Application whose views can be coroutines, served by an ASGI server through ``mvc_asgi.ASGIAdapter``."""
+
+    def set_response_body(self, response, body):
+        if not hasattr(body, '__await__'):
+            return super().set_response_body(response, body)
+
+        async def set_response_body():
+            return super(AsyncApp, self).set_response_body(response, await body)
+
+        return set_response_body()
@@ -0,0 +1,171 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""ASGI adapter of the asynchronous MVC applications."""
+
+import io
+import sys
+import asyncio
+import inspect
+
+from webob import Request, Response, exc
+
+
+def create_environ(scope, body):
+    """WSGI environment of an ASGI ``http`` request scope."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+
+        value = value.decode('latin-1')
+        environ[name] = (environ[name] + ',' + value) if name.startswith('HTTP_') and (name in environ) else value
+
+    return environ
+
+
+class ASGIAdapter:
+    """ASGI application calling ``handle(request, response)`` for each HTTP request.
+
+    ``handle`` returns the response or an awaitable of it. A streamed body can be
+    a synchronous or an asynchronous iterable of bytes.
+
+    When the server supports the ``http.response.early_hint`` extension, the links
+    returned by ``get_early_hints(request)`` are sent in a ``103 Early Hints`` response
+    before ``handle`` is called. Else the ``nagare.early_hints(links)`` callable of the
+    request environment sends them, once ``handle`` gives the control back to the event loop.
+
+    The services chained before the presentation service by the publisher expect a response,
+    not an awaitable, so an ``AsyncApp`` isn't served through them: ``handle`` directly calls
+    ``presentation.handle_request(chain, app, request, response)``, where ``chain.next()``
+    dispatches the request to the views of the application, and its result is awaited here.
+    """
+
+    def __init__(self, handle, request_factory=Request, response_factory=Response, get_early_hints=None):
+        self.handle = handle
+        self.request_factory = request_factory
+        self.response_factory = response_factory
+        self.get_early_hints = get_early_hints
+
+    @staticmethod
+    async def read_body(receive):
+        body = []
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        return b''.join(body)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def create_early_hints_message(links):
+        return {'type': 'http.response.early_hint', 'links': [link.encode('latin-1') for link in links]}
+
+    def create_early_hints_sender(self, send, sent):
+        def send_early_hints(links):
+            sent.append(asyncio.ensure_future(send(self.create_early_hints_message(links))))
+
+        return send_early_hints
+
+    async def create_response(self, request):
+        try:
+            response = self.handle(request, self.response_factory())
+            if inspect.isawaitable(response):
+                response = await response
+        except exc.HTTPException as e:
+            response = request.get_response(e)
+
+        return response
+
+    @staticmethod
+    async def send_response(response, send):
+        headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headerlist]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        chunks = response.app_iter
+        try:
+            if hasattr(chunks, '__aiter__'):
+                async for chunk in chunks:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                for chunk in chunks:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            close = getattr(chunks, 'aclose', None) or getattr(chunks, 'close', None)
+            if close is not None:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope type {!r}'.format(scope['type']))
+
+        body = await self.read_body(receive)
+        if body is None:
+            return None
+
+        environ = create_environ(scope, body)
+        request = self.request_factory(environ)
+
+        early_hints = []
+        if 'http.response.early_hint' in scope.get('extensions', {}):
+            links = self.get_early_hints(request) if self.get_early_hints is not None else None
+            if links:
+                await send(self.create_early_hints_message(links))
+            else:
+                environ['nagare.early_hints'] = self.create_early_hints_sender(send, early_hints)
+
+        response = await self.create_response(request)
+
+        await asyncio.gather(*early_hints)
+        await self.send_response(response, send)
@@ -0,0 +1,360 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Backends of the presentation service response cache."""
+
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+import contextlib
+import collections
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(collections.namedtuple('CachedResponse', ('status', 'headers', 'body', 'expires'), defaults=(0,))):
+    """Status, headers list and serialized body of a response, with its expiration time once cached."""
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return len(self.body)
+
+    @property
+    def ttl(self):
+        return self.expires - time.time()
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.status, list(response.headerlist), response.body)
+
+    def to_response(self, response):
+        response.status = self.status
+        response.headerlist = list(self.headers)
+        response.body = self.body
+
+        return response
+
+
+class MemoryCache:
+    """In process LRU cache."""
+
+    def __init__(self, ttl=60, max_entries=1000, max_size=64 * 1024 * 1024, **config):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def _delete(self, key):
+        self.size -= self.entries.pop(key).size
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry.expires < time.time():
+                self._delete(key)
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, entry, ttl=None):
+        if entry.size > self.max_size:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._delete(key)
+
+            self.entries[key] = entry._replace(expires=time.time() + (ttl or self.ttl))
+            self.size += entry.size
+
+            while (len(self.entries) > self.max_entries) or (self.size > self.max_size):
+                self._delete(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class FileSystemCache:
+    """Cache shared by all the processes of a host, one file per entry.
+
+    A file is a JSON header line followed by the body. Its modification time is
+    refreshed on each hit so that the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory='', ttl=60, max_entries=1000, max_size=64 * 1024 * 1024, **config):
+        import tempfile
+
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'nagare-mvc-cache')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_filename(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        filename = self.get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+
+            if header['expires'] < time.time():
+                os.remove(filename)
+                return None
+
+            os.utime(filename)
+        except (OSError, ValueError):
+            return None
+
+        headers = [tuple(name_value) for name_value in header['headers']]
+
+        return CachedResponse(header['status'], headers, body, header['expires'])
+
+    def set(self, key, entry, ttl=None):
+        if entry.size > self.max_size:
+            return
+
+        header = {'expires': time.time() + (ttl or self.ttl), 'status': entry.status, 'headers': entry.headers}
+
+        import tempfile
+
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(entry.body)
+
+        os.replace(tmp_filename, self.get_filename(key))
+
+        self.evict()
+
+    def evict(self):
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.directory)
+                if not entry.name.startswith('.')
+            ]
+        except OSError:
+            return
+
+        size = sum(entry[1] for entry in entries)
+        entries.sort(reverse=True)
+
+        while entries and ((len(entries) > self.max_entries) or (size > self.max_size)):
+            _, entry_size, filename = entries.pop()
+            size -= entry_size
+            self.delete_file(filename)
+
+    @staticmethod
+    def delete_file(filename):
+        with contextlib.suppress(OSError):
+            os.remove(filename)
+
+    def delete(self, key):
+        self.delete_file(self.get_filename(key))
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            self.delete_file(entry.path)
+
+
+class SharedMemoryCache:
+    """Cache shared by all the processes of a host, in a memory mapped file.
+
+    The file is a table of ``max_entries`` slots of ``slot_size`` bytes, ``max_size / max_entries``
+    by default, grouped in sets of up to ``WAYS`` slots. An entry can only be stored in the set of
+    its key, where the expired or the least recently used slot is replaced. The responses larger
+    than a slot are not cached.
+
+    The file is named after the ``namespace`` of the cache, so that the applications of a host
+    don't share their entries.
+
+    The reads take no lock: the sequence number of a slot is odd while it's written and is
+    checked again once the slot is copied. The writes of a set are serialized by a lock on
+    its range of the file.
+    """
+
+    WAYS = 8
+    SLOT_HEADER = struct.Struct('<Q16sddI')  # Sequence, key digest, expiration time, access time, data length
+    ACCESS_TIME = struct.Struct('<d')
+    ACCESS_TIME_OFFSET = 32
+
+    def __init__(
+        self, directory='', ttl=60, max_entries=1000, max_size=64 * 1024 * 1024, namespace='', slot_size=0, **config
+    ):
+        import fcntl
+        import tempfile
+
+        if max_entries <= 0:
+            raise ValueError('max_entries of the shared memory cache must be positive, not {}'.format(max_entries))
+
+        if not directory:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()  # noqa: S108
+
+        self.ttl = ttl
+        self.ways = min(self.WAYS, max_entries)
+        self.nb_sets = max_entries // self.ways
+        slot_size = slot_size or (max_size // (self.nb_sets * self.ways))
+        self.slot_size = max(slot_size, self.SLOT_HEADER.size + 256)
+        self.set_size = self.slot_size * self.ways
+        self.lock = threading.Lock()
+        self.oversized = False
+
+        filename = 'nagare-mvc-cache-{}{}x{}'.format(
+            namespace.replace(os.sep, '_') + '-' if namespace else '', self.nb_sets * self.ways, self.slot_size
+        )
+        self.fd = os.open(os.path.join(directory, filename), os.O_RDWR | os.O_CREAT, 0o600)
+
+        size = self.nb_sets * self.set_size
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+        self.memory = mmap.mmap(self.fd, size)
+
+    @staticmethod
+    def get_digest(key):
+        return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+
+    def get_slots(self, digest):
+        first = (int.from_bytes(digest[:8], 'little') % self.nb_sets) * self.set_size
+
+        return range(first, first + self.set_size, self.slot_size)
+
+    @contextlib.contextmanager
+    def lock_set(self, start):
+        import fcntl
+
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.set_size, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.set_size, start)
+
+    def write_slot(self, offset, digest=bytes(16), expires=0, data=b''):
+        # The sequence can already be odd if a process died while writing the slot
+        odd = self.SLOT_HEADER.unpack_from(self.memory, offset)[0] | 1
+        struct.pack_into('<Q', self.memory, offset, odd)
+
+        data_offset = offset + self.SLOT_HEADER.size
+        self.memory[data_offset : data_offset + len(data)] = data
+        self.SLOT_HEADER.pack_into(self.memory, offset, odd + 1, digest, expires, time.time(), len(data))
+
+    def get(self, key):
+        digest = self.get_digest(key)
+        now = time.time()
+
+        for offset in self.get_slots(digest):
+            sequence, slot_digest, expires, _, length = self.SLOT_HEADER.unpack_from(self.memory, offset)
+            if (slot_digest != digest) or (sequence & 1):
+                continue
+
+            if expires < now:
+                return None
+
+            data_offset = offset + self.SLOT_HEADER.size
+            data = self.memory[data_offset : data_offset + length]
+            if struct.unpack_from('<Q', self.memory, offset)[0] != sequence:
+                return None
+
+            self.ACCESS_TIME.pack_into(self.memory, offset + self.ACCESS_TIME_OFFSET, now)
+
+            try:
+                header, body = data.split(b'\n', 1)
+                header = json.loads(header)
+                headers = [tuple(name_value) for name_value in header['headers']]
+            except (ValueError, KeyError, TypeError):
+                return None
+
+            return CachedResponse(header['status'], headers, body, expires)
+
+        return None
+
+    def set(self, key, entry, ttl=None):
+        data = json.dumps({'status': entry.status, 'headers': entry.headers}).encode('utf-8') + b'\n' + entry.body
+        if len(data) > (self.slot_size - self.SLOT_HEADER.size):
+            if not self.oversized:
+                self.oversized = True
+                logger.warning(
+                    'Response of %d bytes not cached, larger than the %d bytes slots of the cache',
+                    len(data),
+                    self.slot_size,
+                )
+
+            return
+
+        digest = self.get_digest(key)
+        now = time.time()
+
+        slots = self.get_slots(digest)
+        with self.lock_set(slots.start):
+            candidates = []
+            for offset in slots:
+                _, slot_digest, expires, access_time, _ = self.SLOT_HEADER.unpack_from(self.memory, offset)
+                if slot_digest == digest:
+                    break
+
+                candidates.append((access_time if expires >= now else 0, offset))
+            else:
+                offset = min(candidates)[1]
+
+            self.write_slot(offset, digest, now + (ttl or self.ttl), data)
+
+    def delete(self, key):
+        digest = self.get_digest(key)
+
+        slots = self.get_slots(digest)
+        with self.lock_set(slots.start):
+            for offset in slots:
+                if self.SLOT_HEADER.unpack_from(self.memory, offset)[1] == digest:
+                    self.write_slot(offset)
+
+    def clear(self):
+        for start in range(0, self.nb_sets * self.set_size, self.set_size):
+            with self.lock_set(start):
+                for offset in range(start, start + self.set_size, self.slot_size):
+                    self.write_slot(offset)
+
+
+def load_backend(name):
+    """Load a cache backend class registered in the ``nagare.presentation.caches`` entry points."""
+    from importlib import metadata
+
+    (entry,) = metadata.entry_points(group='nagare.presentation.caches', name=name)
+
+    return entry.load()
@@ -0,0 +1,275 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Fragments of a page rendered concurrently."""
+
+import asyncio
+import inspect
+import logging
+from concurrent import futures
+
+from lxml import etree
+
+PLACEHOLDER_TARGET = 'nagare-deferred'
+MARKER_ID = 'nagare-deferred-{}'
+CONTENT_ID = 'nagare-deferred-content-{}'
+END_MARKER = '/nagare-deferred'
+
+logger = logging.getLogger(__name__)
+
+# Replace the marker of the fragment ``n``, and the fallback nodes after it, by the content of its template
+SWAP_SCRIPT = (
+    'function nagareSwap(n){'
+    "var m=document.getElementById('nagare-deferred-'+n),t=document.getElementById('nagare-deferred-content-'+n);"
+    'if(!m)return;'
+    "for(var e=m.nextSibling;e&&!(e.nodeType===8&&e.data==='/nagare-deferred');e=m.nextSibling)e.remove();"
+    'if(e)e.remove();'
+    'm.replaceWith(t.content);t.remove()}'
+)
+
+
+def create_executor(max_workers=8):
+    return futures.ThreadPoolExecutor(max_workers, thread_name_prefix='nagare-deferred')
+
+
+def to_list(nodes):
+    if nodes is None:
+        return []
+
+    return list(nodes) if isinstance(nodes, (list, tuple)) else [nodes]
+
+
+def filter_declared(entries, declared):
+    """Head entries not already in ``declared``, the set of the serialized entries, which is updated."""
+    for entry in entries:
+        serialized = etree.tostring(entry)
+        if serialized not in declared:
+            declared.add(serialized)
+            yield entry
+
+
+def graft(placeholder, nodes):
+    """Replace ``placeholder``, child of an element, by ``nodes``: an element, a string or a list of them."""
+    parent = placeholder.getparent()
+
+    previous = placeholder.getprevious()
+    index = parent.index(placeholder)
+    tail = placeholder.tail
+    parent.remove(placeholder)
+
+    def add_text(text):
+        if previous is None:
+            parent.text = (parent.text or '') + text
+        else:
+            previous.tail = (previous.tail or '') + text
+
+    for node in to_list(nodes):
+        if isinstance(node, str):
+            add_text(node)
+        else:
+            parent.insert(index, node)
+            index += 1
+            previous = node
+
+    if tail:
+        add_text(tail)
+
+
+class DeferredFragments:
+    """Fragments of a request rendered concurrently, grafted into the tree before its serialization.
+
+    A fragment is rendered by ``builder(h)`` as soon as it's declared, with a new renderer ``h``
+    and its own head renderer: in a worker thread or, for a coroutine function, as a task of the
+    event loop of the request. The page latency is then the latency of its slowest fragment, not
+    the sum of them.
+
+    The head entries of the rendered fragments are collected in ``head`` and ``bottom``. A late
+    builder can't be interrupted: it keeps its worker thread until it returns, only writing into
+    its own renderer, so the builders must bound their own latency.
+    """
+
+    def __init__(self, create_renderer, executor, timeout=None, release_renderer=None):
+        self.create_renderer = create_renderer
+        self.release_renderer = release_renderer
+        self.executor = executor
+        self.timeout = timeout
+        self.fragments = []
+        self.head = []
+        self.bottom = []
+
+    @property
+    def is_async(self):
+        """Check if some fragments are rendered by the event loop."""
+        return any(hasattr(job, 'get_loop') for _, job, _, _ in self.fragments)
+
+    @staticmethod
+    def get_head_entries(h):
+        """Entries declared in the head renderer of a fragment: the ones of the top and of the bottom."""
+        head = getattr(h, 'head', None)
+        if head is None:
+            return [], []
+
+        return list(head.render_top()), list(head.render_bottom())
+
+    def done(self, h):
+        """Collect the head entries of a rendered fragment and give back its renderer."""
+        head, bottom = self.get_head_entries(h)
+        self.head.extend(head)
+        self.bottom.extend(bottom)
+
+        if self.release_renderer is not None:
+            self.release_renderer(h)
+
+        return head + bottom
+
+    def render(self, builder, fallback=None):
+        """Placeholder of a fragment in the renderer tree.
+
+        Args:
+            builder: ``builder(h)`` returns the nodes of the fragment
+            fallback: nodes of the fragment if it fails or isn't rendered within the timeout
+
+        Returns:
+            a processing instruction to put in the renderer tree or to return as output
+        """
+        h = self.create_renderer()
+        if inspect.iscoroutinefunction(builder):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError('a coroutine function fragment must be rendered by an asynchronous view') from None
+
+            job = loop.create_task(builder(h))
+        else:
+            job = self.executor.submit(builder, h)
+
+        placeholder = etree.ProcessingInstruction(PLACEHOLDER_TARGET, str(len(self.fragments)))
+        self.fragments.append((placeholder, job, fallback, h))
+
+        return placeholder
+
+    def replace(self, body, replacements):
+        """Replace the placeholders, in ``body`` or at its top level, by their ``replacements`` nodes.
+
+        Returns:
+            the body, a list if some of its top level nodes were replaced
+        """
+        roots = {}
+        for (placeholder, _, _, _), nodes in zip(self.fragments, replacements):
+            if placeholder.getparent() is not None:
+                graft(placeholder, nodes)
+            else:
+                roots[placeholder] = nodes
+
+        if roots:
+            nodes, body = to_list(body), []
+            for node in nodes:
+                body.extend(to_list(roots[node]) if node in roots else [node])
+
+        return body
+
+    def assemble(self, body):
+        """Wait for the fragments rendered in the worker threads and graft them into ``body``."""
+        if self.is_async:
+            raise RuntimeError('fragments rendered by an event loop must be assembled asynchronously')
+
+        done, _ = futures.wait([job for _, job, _, _ in self.fragments], self.timeout)
+
+        return self.graft_all(body, done)
+
+    async def assemble_async(self, body):
+        """Wait for all the fragments, without blocking the event loop, and graft them into ``body``."""
+        if not self.fragments:
+            return body
+
+        jobs = {job if hasattr(job, 'get_loop') else asyncio.wrap_future(job): job for _, job, _, _ in self.fragments}
+        done, _ = await asyncio.wait(jobs, timeout=self.timeout)
+
+        return self.graft_all(body, {jobs[job] for job in done})
+
+    def graft_all(self, body, done):
+        """Graft the rendered fragments, or the fallback nodes of the failed or late ones.
+
+        The renderers of the late fragments are dropped, never reused: their builders can still be running.
+        """
+        replacements = []
+        for i, (_, job, fallback, h) in enumerate(self.fragments):
+            nodes = fallback
+            if job not in done:
+                job.cancel()
+            else:
+                try:
+                    nodes = job.result()
+                except Exception:
+                    logger.exception('Rendering of the deferred fragment %d failed', i)
+                else:
+                    self.done(h)
+
+            replacements.append(nodes)
+
+        body = self.replace(body, replacements)
+        self.fragments = []
+
+        return body
+
+    def set_markers(self, h, body):
+        """Replace the placeholders by the markers of the fragments streamed out of order.
+
+        A marker is an empty ``<template>``, created by the renderer ``h``, followed by the fallback
+        nodes of the fragment up to an end comment. The fragments must then be serialized by ``stream()``.
+        """
+        return self.replace(
+            body,
+            [
+                [h.template(id=MARKER_ID.format(i))] + to_list(fallback) + [etree.Comment(END_MARKER)]
+                for i, (_, _, fallback, _) in enumerate(self.fragments)
+            ],
+        )
+
+    def stream(self, serialize, encoding='utf-8', declared=None):
+        """Serialize the fragments rendered in the worker threads as soon as they are rendered.
+
+        Each fragment is serialized in a ``<template>`` followed by a script swapping it with its
+        marker. The fragments failed or not rendered within the timeout keep their fallback nodes.
+
+        The head of the page is already sent, so the new head entries of a fragment are put in
+        its ``<template>``, before its nodes: the stylesheets and the scripts are loaded when the
+        fragment is swapped into the page.
+
+        Args:
+            serialize: ``serialize(nodes, encoding)`` returns the bytes of the nodes
+            encoding: encoding of the chunks
+            declared: set of the serialized head entries already in the page
+
+        Yields:
+            a chunk of bytes by fragment
+        """
+        jobs = {job: (i, h) for i, (_, job, _, h) in enumerate(self.fragments)}
+        self.fragments = []
+        declared = set() if declared is None else declared
+
+        try:
+            for job in futures.as_completed(jobs, self.timeout):
+                i, h = jobs[job]
+                try:
+                    nodes = job.result()
+                except Exception:
+                    logger.exception('Rendering of the deferred fragment %d failed', i)
+                    continue
+
+                entries = list(filter_declared(self.done(h), declared))
+
+                yield (
+                    '<template id="{}">'.format(CONTENT_ID.format(i)).encode(encoding)
+                    + serialize(entries + to_list(nodes), encoding)
+                    + '</template><script>nagareSwap({})</script>'.format(i).encode(encoding)
+                )
+        except futures.TimeoutError:
+            for job in jobs:
+                job.cancel()
@@ -0,0 +1,87 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Cache of serialized renderer subtrees."""
+
+import re
+import secrets
+import collections
+
+from lxml import etree
+
+PLACEHOLDER_TARGET = 'nagare-fragment'
+PLACEHOLDERS = re.compile(rb'<\?nagare-fragment ([0-9a-f]+) (\d+)\??>')
+
+
+class CachedFragment(collections.namedtuple('CachedFragment', ('body', 'expires'), defaults=(0,))):
+    """UTF-8 serialization of a subtree, with its expiration time once cached."""
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return len(self.body)
+
+
+class Fragments:
+    """Fragments of a request, spliced into the output once it is serialized.
+
+    A fragment is built and serialized only if it's not in the cache, so it must not
+    declare resources on the head renderer.
+
+    The placeholders carry a random token of the request, so a placeholder forged in
+    the content of the page is never spliced.
+    """
+
+    def __init__(self, h, cache, serialize):
+        self.h = h
+        self.cache = cache
+        self.serialize = serialize
+        self.token = secrets.token_hex(8)
+        self.fragments = []
+
+    def render(self, key, builder, ttl=None):
+        """Placeholder of the fragment ``key`` in the renderer tree.
+
+        Args:
+            key: hashable identifier of the fragment
+            builder: ``builder(h)`` returns the nodes of the fragment
+            ttl: time to live of the fragment in the cache, in seconds
+
+        Returns:
+            a processing instruction to put in the renderer tree
+        """
+        fragment = self.cache.get(key)
+        if fragment is None:
+            fragment = CachedFragment(self.serialize(builder(self.h), 'utf-8'))
+            self.cache.set(key, fragment, ttl)
+
+        self.fragments.append(fragment.body)
+
+        return etree.ProcessingInstruction(PLACEHOLDER_TARGET, '{} {}'.format(self.token, len(self.fragments) - 1))
+
+    def splice(self, output, encoding='utf-8'):
+        """Replace the placeholders of ``output``, encoded with an ASCII compatible ``encoding``."""
+        if not self.fragments:
+            return output
+
+        fragments = self.fragments
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            fragments = [fragment.decode('utf-8').encode(encoding, 'xmlcharrefreplace') for fragment in fragments]
+
+        token = self.token.encode('ascii')
+
+        def replace(placeholder):
+            i = int(placeholder.group(2))
+            if (placeholder.group(1) != token) or (i >= len(fragments)):
+                return placeholder.group(0)
+
+            return fragments[i]
+
+        return PLACEHOLDERS.sub(replace, output)
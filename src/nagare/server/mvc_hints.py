@@ -0,0 +1,51 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Preload links of the resources declared on the head renderer."""
+
+import collections
+from urllib.parse import quote
+
+from lxml import etree
+
+RESOURCES = etree.XPath('descendant-or-self::link[@rel="stylesheet"][@href] | descendant-or-self::script[@src]')
+URL_SAFE_CHARACTERS = "/:?#[]@!$&'()*+,;=%~"  # Reserved characters and already percent-encoded sequences
+
+
+class CachedLinks(collections.namedtuple('CachedLinks', ('links', 'expires'), defaults=(0,))):
+    """``Link`` header values of a page, with their expiration time once cached."""
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return sum(len(link) for link in self.links)
+
+
+def create_preload_links(nodes):
+    """``Link`` header values preloading the stylesheets and the scripts of ``nodes``, in document order.
+
+    The URLs are percent-encoded, so that the values are ASCII.
+    """
+    links = {}
+    for node in nodes:
+        if not isinstance(node, etree._Element):
+            continue
+
+        for resource in RESOURCES(node):
+            if resource.tag == 'link':
+                link = '<{}>; rel=preload; as=style'.format(quote(resource.get('href'), URL_SAFE_CHARACTERS))
+            elif resource.get('type') == 'module':
+                link = '<{}>; rel=modulepreload'.format(quote(resource.get('src'), URL_SAFE_CHARACTERS))
+            else:
+                link = '<{}>; rel=preload; as=script'.format(quote(resource.get('src'), URL_SAFE_CHARACTERS))
+
+            links[link] = None
+
+    return tuple(links)
@@ -0,0 +1,184 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Instrumentation of the presentation pipeline."""
+
+import time
+import bisect
+import threading
+import collections
+
+
+class Timings:
+    """Durations and output sizes of the successive stages of a request."""
+
+    memory = None
+
+    def __init__(self):
+        self.stages = []
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, stage, size=None):
+        """Record the end of ``stage``, started at the end of the previous one."""
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last, size))
+        self.last = now
+
+    def stop(self):
+        """End of the timed request."""
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+    def to_header(self):
+        """``Server-Timing`` header value, durations in milliseconds."""
+        metrics = [
+            '{};dur={:.3f}'.format(stage, duration * 1000) + ('' if size is None else ';desc="{}B"'.format(size))
+            for stage, duration, size in self.stages
+        ]
+
+        if self.memory is not None:
+            metrics.append('memory;desc="{}B"'.format(self.memory))
+
+        return ', '.join(metrics + ['total;dur={:.3f}'.format(self.total * 1000)])
+
+
+class MemoryTimings(Timings):
+    """Timings also recording the peak of the Python allocations up to the last stage.
+
+    The allocations are only traced while some requests are timed, from the creation of the
+    first recorder to the ``stop()`` of the last one. The peak is process wide and reset by each
+    request, so the memory numbers are only meaningful with one worker thread. The libxml2
+    allocations are not traced.
+    """
+
+    lock = threading.Lock()
+    tracing = 0  # Number of requests tracing the allocations, if the tracing was started by them
+
+    def __init__(self):
+        import tracemalloc
+
+        with self.lock:
+            if MemoryTimings.tracing or not tracemalloc.is_tracing():
+                if not MemoryTimings.tracing:
+                    tracemalloc.start()
+
+                MemoryTimings.tracing += 1
+                self.stopped = False
+            else:
+                self.stopped = True  # Tracing started by somebody else: never stopped here
+
+        tracemalloc.reset_peak()
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.memory = 0
+
+        super().__init__()
+
+    def mark(self, stage, size=None):
+        import tracemalloc
+
+        super().mark(stage, size)
+        self.memory = max(self.memory, tracemalloc.get_traced_memory()[1] - self.start_memory)
+
+    def stop(self):
+        """Stop tracing the allocations if no other request is timed."""
+        import tracemalloc
+
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+
+                MemoryTimings.tracing -= 1
+                if not MemoryTimings.tracing:
+                    tracemalloc.stop()
+
+
+class NullTimings:
+    """Timings recorder used when the instrumentation is off."""
+
+    stages = ()
+
+    def mark(self, stage, size=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_TIMINGS = NullTimings()
+
+
+class Histogram:
+    """Counts of values in exponential buckets."""
+
+    def __init__(self, first_bound, nb_buckets, factor=2):
+        self.bounds = [first_bound * factor**i for i in range(nb_buckets)]
+        self.buckets = [0] * (nb_buckets + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the ``p`` percentile."""
+        threshold = self.count * p / 100
+        total = 0
+        for bound, count in zip(self.bounds + [self.max], self.buckets):
+            total += count
+            if total >= threshold:
+                return min(bound, self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """In process aggregation of the timings of all the requests.
+
+    The durations, in seconds, are aggregated by stage from 10µs to ~80s
+    and the sizes, in bytes, from 64B to ~128MB.
+    """
+
+    def __init__(self):
+        self.durations = collections.defaultdict(lambda: Histogram(0.00001, 24))
+        self.sizes = collections.defaultdict(lambda: Histogram(64, 22))
+        self.lock = threading.Lock()
+
+    def __call__(self, request, response, timings):
+        with self.lock:
+            for stage, duration, size in timings.stages:
+                self.durations[stage].add(duration)
+                if size is not None:
+                    self.sizes[stage].add(size)
+
+            self.durations['total'].add(timings.total)
+            if timings.memory is not None:
+                self.sizes['memory'].add(timings.memory)
+
+    def report(self):
+        with self.lock:
+            return {
+                'durations': {stage: histogram.to_dict() for stage, histogram in self.durations.items()},
+                'sizes': {stage: histogram.to_dict() for stage, histogram in self.sizes.items()},
+            }
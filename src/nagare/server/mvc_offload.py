@@ -0,0 +1,109 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Bounded pool of threads serializing the large pages."""
+
+import itertools
+import threading
+
+
+def count_reaches(nodes, threshold):
+    """Check, without walking the whole tree, if ``nodes`` have at least ``threshold`` elements.
+
+    Args:
+        nodes: an element or a list of elements
+        threshold: number of elements
+
+    Returns:
+        ``True`` if the threshold is reached
+    """
+    if not isinstance(nodes, (list, tuple)):
+        nodes = (nodes,)
+
+    elements = itertools.chain.from_iterable(node.iter() for node in nodes if hasattr(node, 'iter'))
+
+    return next(itertools.islice(elements, threshold - 1, None), None) is not None
+
+
+class Offloader:
+    """Run jobs in a pool of ``max_workers`` threads.
+
+    At most ``max_pending`` jobs wait for a free worker: beyond that, the submitters are
+    blocked until a job completes.
+    """
+
+    def __init__(self, max_workers=4, max_pending=16):
+        from concurrent import futures
+
+        self.executor = futures.ThreadPoolExecutor(max_workers, thread_name_prefix='nagare-offload')
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+        self.lock = threading.Lock()
+        self.submitted = self.pending = self.max_pending = self.blocked = 0
+
+    def release_slot(self, future):
+        with self.lock:
+            self.pending -= 1
+
+        self.slots.release()
+
+    def submit(self, timings, f, *args):
+        with self.lock:
+            self.submitted += 1
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+
+        def job():
+            timings.mark('offload_wait')
+            return f(*args)
+
+        future = self.executor.submit(job)
+        future.add_done_callback(self.release_slot)
+
+        return future
+
+    def run(self, timings, f, *args):
+        """Call ``f(*args)`` in a worker and wait for its result."""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.blocked += 1
+
+            self.slots.acquire()
+
+        return self.submit(timings, f, *args).result()
+
+    async def run_async(self, timings, f, *args):
+        """Call ``f(*args)`` in a worker without blocking the event loop."""
+        import asyncio
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.blocked += 1
+
+            acquire = asyncio.ensure_future(asyncio.to_thread(self.slots.acquire))
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # The thread can't be interrupted: give back the slot once it's acquired
+                acquire.add_done_callback(lambda _: self.slots.release())
+                raise
+
+        return await asyncio.wrap_future(self.submit(timings, f, *args))
+
+    def report(self):
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'blocked': self.blocked,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,182 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+"""Pre-forking WSGI server of the MVC applications."""
+
+import gc
+import os
+import time
+import signal
+import socket
+import contextlib
+from wsgiref import simple_server
+
+from webob import Request, Response, exc
+
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def create_wsgi_app(handle, request_factory=Request, response_factory=Response):
+    """WSGI application calling ``handle(request, response)`` for each HTTP request."""
+
+    def wsgi_app(environ, start_response):
+        try:
+            response = handle(request_factory(environ), response_factory())
+        except exc.HTTPException as e:
+            response = e
+
+        return response(environ, start_response)
+
+    return wsgi_app
+
+
+class RequestHandler(simple_server.WSGIRequestHandler):
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class PreforkServer:
+    """Serve a WSGI application from ``nb_workers`` processes forked from a warm master.
+
+    The master creates the listening socket and calls ``warmup()`` before forking, so that the
+    modules, renderer classes, skeletons and caches it creates are shared copy-on-write
+    by all the workers instead of being created again by each of them. With no worker, the master
+    serves the requests itself.
+
+    A dead worker is replaced, at most once per ``restart_interval`` seconds if it died before
+    running that long. After ``max_failures`` such workers in a row, the server stops.
+    """
+
+    def __init__(
+        self,
+        app,
+        host='127.0.0.1',
+        port=8080,
+        nb_workers=None,
+        warmup=None,
+        backlog=128,
+        reuse_port=False,
+        restart_interval=1.0,
+        max_failures=5,
+    ):
+        self.app = app
+        self.address = (host, port)
+        self.nb_workers = os.cpu_count() if nb_workers is None else nb_workers
+        self.warmup = warmup
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        self.restart_interval = restart_interval
+        self.max_failures = max_failures
+
+        self.socket = None
+        self.workers = {}  # Start time of each worker
+        self.stopping = False
+
+    def create_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(self.address)
+        sock.listen(self.backlog)
+        self.address = sock.getsockname()[:2]
+
+        return sock
+
+    def create_server(self):
+        server = simple_server.WSGIServer(self.address, RequestHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = self.socket
+
+        server.server_address = host, port = self.socket.getsockname()[:2]
+        server.server_name = socket.getfqdn(host)
+        server.server_port = port
+        server.setup_environ()
+        server.set_app(self.app)
+
+        return server
+
+    def serve_worker(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+        self.create_server().serve_forever()
+
+    def spawn_worker(self):
+        # A stop signal received before the worker is registered would never be forwarded to it
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    self.serve_worker()
+                    status = 0
+                finally:
+                    os._exit(status)
+
+            self.workers[pid] = time.monotonic()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    def serve(self):
+        self.socket = self.create_socket()
+        if self.warmup is not None:
+            self.warmup()
+
+        if not self.nb_workers:
+            self.create_server().serve_forever()
+            return
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Move all the objects created so far out of the collected generations, so that
+        # the collections of the workers don't write into the shared pages
+        gc.freeze()
+
+        for _ in range(self.nb_workers):
+            self.spawn_worker()
+
+        failures = 0
+        while self.workers:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+
+            lifetime = time.monotonic() - self.workers.pop(pid, 0)
+            if self.stopping:
+                continue
+
+            if lifetime >= self.restart_interval:
+                failures = 0
+            else:
+                failures += 1
+                if failures >= self.max_failures:
+                    self.stop()
+                    continue
+
+                time.sleep(self.restart_interval - lifetime)
+
+            if not self.stopping:
+                self.spawn_worker()
+
+        self.socket.close()
+
+        if failures >= self.max_failures:
+            raise RuntimeError('{} workers in a row died at startup'.format(failures))
@@ -7,33 +7,295 @@
 # this distribution.
 # --
 
+import io
+import re
+import sys
+import copy
+import json
+import zlib
 import types
+import hashlib
+import weakref
+import itertools
+import threading
 
 from lxml import etree
 from webob import Response
 
+from nagare.server import mvc_metrics, mvc_offload
 from nagare.services import plugin
 
+SEQUENCES = (list, tuple, types.GeneratorType)
+PRESERVED_TAGS = ('pre', 'textarea', 'script', 'style')
+WHITESPACES = re.compile(r'[ \t\n\r\f]+')  # HTML whitespaces only, not the non-breaking spaces
+CANONICAL_LINKS = etree.XPath('./link[@rel="canonical"]')
+SKELETON_MARKERS = re.compile(rb'<\?nagare-skeleton ?\??>')
+COMPRESSION_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def is_awaitable(o):
+    return hasattr(o, '__await__')
+
+
+def in_event_loop():
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return False
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+
+    return True
+
 
 class PresentationService(plugin.Plugin):
     CONFIG_SPEC = plugin.Plugin.CONFIG_SPEC | {
         'canonical_url': 'boolean(default=True)',
         'frame_options': 'string(default="deny")',
+        'pretty_print': 'boolean(default=False)',
+        'minify': 'boolean(default=False)',
+        'streaming': 'boolean(default=False)',
+        'chunk_size': 'integer(default=8192)',
+        'etag': 'boolean(default=False)',
+        'skeleton': 'boolean(default=False)',
+        'xhr_fast_path': 'boolean(default=False)',
+        'cache': {
+            'activated': 'boolean(default=False)',
+            'backend': 'string(default="memory")',
+            'default': 'boolean(default=True)',
+            'ttl': 'integer(default=60)',
+            'max_entries': 'integer(default=1000)',
+            'max_size': 'integer(default=67108864)',
+            'vary': 'string_list(default=list("Accept-Language"))',
+            'directory': 'string(default="")',
+            'namespace': 'string(default="")',
+            'slot_size': 'integer(default=0)',
+            'stale': 'integer(default=0)',
+            'coalescing': 'boolean(default=False)',
+            'coalescing_timeout': 'float(default=10)',
+        },
+        'compression': {
+            'activated': 'boolean(default=False)',
+            'encodings': 'string_list(default=list("gzip", "deflate"))',
+            'level': 'integer(default=6)',
+            'min_size': 'integer(default=1024)',
+            'content_types': (
+                'string_list(default=list("text/html", "text/xml", "application/xhtml+xml", "application/json"))'
+            ),
+        },
+        'fragments': {
+            'activated': 'boolean(default=False)',
+            'ttl': 'integer(default=60)',
+            'max_entries': 'integer(default=1000)',
+            'max_size': 'integer(default=16777216)',
+        },
+        'deferred': {
+            'activated': 'boolean(default=False)',
+            'max_workers': 'integer(default=8)',
+            'timeout': 'float(default=0)',
+            'out_of_order': 'boolean(default=False)',
+        },
+        'timing': {
+            'activated': 'boolean(default=False)',
+            'server_timing': 'boolean(default=False)',
+            'histograms': 'boolean(default=True)',
+            'memory': 'boolean(default=False)',
+        },
+        'offload': {
+            'activated': 'boolean(default=False)',
+            'min_elements': 'integer(default=20000)',
+            'max_workers': 'integer(default=4)',
+            'max_pending': 'integer(default=16)',
+        },
+        'limits': {
+            'stream_elements': 'integer(default=0)',
+            'max_elements': 'integer(default=0)',
+            'max_size': 'integer(default=0)',
+        },
+        'preload': {
+            'activated': 'boolean(default=False)',
+            'early_hints': 'boolean(default=True)',
+            'ttl': 'integer(default=3600)',
+            'max_entries': 'integer(default=1000)',
+        },
     }
     LOAD_PRIORITY = 130
 
-    def __init__(self, name, dist, canonical_url=True, frame_options='deny', **config):
-        super().__init__(name, dist, canonical_url=canonical_url, frame_options=frame_options, **config)
+    def __init__(
+        self,
+        name,
+        dist,
+        canonical_url=True,
+        frame_options='deny',
+        pretty_print=False,
+        minify=False,
+        streaming=False,
+        chunk_size=8192,
+        etag=False,
+        skeleton=False,
+        xhr_fast_path=False,
+        cache=None,
+        compression=None,
+        fragments=None,
+        deferred=None,
+        timing=None,
+        offload=None,
+        limits=None,
+        preload=None,
+        **config,
+    ):
+        super().__init__(
+            name,
+            dist,
+            canonical_url=canonical_url,
+            frame_options=frame_options,
+            pretty_print=pretty_print,
+            minify=minify,
+            streaming=streaming,
+            chunk_size=chunk_size,
+            etag=etag,
+            skeleton=skeleton,
+            xhr_fast_path=xhr_fast_path,
+            cache=cache,
+            compression=compression,
+            fragments=fragments,
+            deferred=deferred,
+            timing=timing,
+            offload=offload,
+            limits=limits,
+            preload=preload,
+            **config,
+        )
 
         self.canonical_url = canonical_url
         self.frame_options = frame_options.upper()
+        self.pretty_print = pretty_print and not minify
+        self.minify = minify
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.etag = etag
+        self.skeleton = skeleton
+        self.skeletons = {}
+        self.skeleton_parts = {}
+        self.xhr_fast_path = xhr_fast_path
+
+        cache = dict(cache or {})
+        self.cache_default = cache.pop('default', True)
+        self.cache_vary = cache.pop('vary', ['Accept-Language'])
+        self.cache_stale = cache.pop('stale', 0)
+        self.cache_coalescing = cache.pop('coalescing', False)
+        self.cache_coalescing_timeout = cache.pop('coalescing_timeout', 10)
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+        self.cache = None
+        if cache.pop('activated', False):
+            from nagare.server import mvc_cache
+
+            self.cache = mvc_cache.load_backend(cache.pop('backend', 'memory'))(**cache)
+
+        compression = compression or {}
+        self.compression = compression.get('activated', False)
+        self.compression_encodings = [
+            encoding for encoding in compression.get('encodings', ['gzip', 'deflate']) if encoding in COMPRESSION_WBITS
+        ]
+        self.compression_level = compression.get('level', 6)
+        self.compression_min_size = compression.get('min_size', 1024)
+        self.compression_types = compression.get(
+            'content_types', ['text/html', 'text/xml', 'application/xhtml+xml', 'application/json']
+        )
+
+        fragments = dict(fragments or {})
+        self.fragments = None
+        if fragments.pop('activated', False):
+            from nagare.server import mvc_cache
+
+            self.fragments = mvc_cache.MemoryCache(**fragments)
+
+        deferred = deferred or {}
+        self.deferred_timeout = deferred.get('timeout', 0) or None
+        self.deferred_out_of_order = deferred.get('out_of_order', False)
+        self.deferred = None
+        if deferred.get('activated', False):
+            from nagare.server import mvc_deferred
+
+            self.deferred = mvc_deferred.create_executor(deferred.get('max_workers', 8))
+
+        timing = timing or {}
+        self.timing = timing.get('activated', False)
+        self.server_timing = timing.get('server_timing', False)
+        self.timing_memory = timing.get('memory', False)
+        self.metrics = mvc_metrics.Metrics() if self.timing and timing.get('histograms', True) else None
+        self.metrics_callbacks = [self.metrics] if self.metrics is not None else []
+
+        offload = dict(offload or {})
+        self.offload_min_elements = offload.pop('min_elements', 20000)
+        self.offload = mvc_offload.Offloader(**offload) if offload.pop('activated', False) else None
+
+        limits = limits or {}
+        self.stream_elements = limits.get('stream_elements', 0)
+        self.max_elements = limits.get('max_elements', 0)
+        self.max_size = limits.get('max_size', 0)
+
+        preload = dict(preload or {})
+        self.early_hints = preload.pop('early_hints', True)
+        self.preloads = None
+        if preload.pop('activated', False):
+            from nagare.server import mvc_cache
+
+            self.preloads = mvc_cache.MemoryCache(**preload)
+
+    def handle_start(self, app):
+        """Create the first renderers, skeleton and serialization state before the first request."""
+        h = app.create_renderer()
+        self.serialize(h.html(h.head.head, h.body()), 'utf-8', h.doctype)
+
+        if self.skeleton:
+            key = (app, Response.default_charset, h.doctype)
+            if key not in self.skeletons:
+                self.skeletons[key] = self.create_skeleton(app, Response.default_charset, h.doctype)
+
+        self.release_renderer(app, h)
+
+    def add_metrics_callback(self, callback):
+        """Register a ``callback(request, response, timings)`` called at the end of each timed request."""
+        self.metrics_callbacks.append(callback)
+
+    @staticmethod
+    def get_canonical_url(request):
+        """Canonical URL of the request, computed once per request."""
+        url = request.environ.get('nagare.canonical_url')
+        if url is None:
+            path = request.upath_info.strip('/')
+            url = request.environ['nagare.canonical_url'] = request.uscript_name + ('/' if path else '') + path
+
+        return url
+
+    @staticmethod
+    def find_unique(nodes, tag):
+        found = None
+        for node in nodes:
+            if isinstance(node, etree.ElementBase) and (node.tag == tag):
+                if found is not None:
+                    return None
+
+                found = node
 
-    def merge_head(self, request, h, head, bottom, html):
+        return found
+
+    def merge_head(self, request, h, head, bottom, html, skeleton=None):
+        """Merge the head entries, the bottom entries and the output into a ``<html>`` tree.
+
+        The ``skeleton`` static parts, from ``get_skeleton_parts()``, are merged too: its ``<html>``
+        and ``<head>`` attributes unless the page sets them, its head entries before the ones of
+        the page and its bottom entries after.
+        """
         root = h.html(html)
-        existing_html = [tag for tag in root if isinstance(tag, etree.ElementBase) and tag.tag == 'html']
-        if len(existing_html) == 1:
+        existing_html = self.find_unique(root, 'html')
+        if existing_html is not None:
             root = html
-            html = existing_html[0]
+            html = existing_html
         else:
             html = root
 
@@ -43,22 +305,31 @@ class PresentationService(plugin.Plugin):
         if existing_head is None:
             existing_head = h.head.head
             html.insert(0, existing_head)
-            i = 1
-        else:
-            i = html.index(existing_head) + 1
 
-        existing_body = [tag for tag in html[i:] if isinstance(tag, etree.ElementBase) and tag.tag == 'body']
-        if len(existing_body) == 1:
-            body = existing_body[0]
-        else:
-            body = h.body(existing_head.tail or '', html.text or '', html[i:])
+        body = self.find_unique(existing_head.itersiblings(), 'body')
+        if body is None:
+            body = h.body(existing_head.tail or '', html.text or '')
             existing_head.tail = html.text = None
+
+            node = existing_head.getnext()
+            while node is not None:
+                body.append(node)
+                node = existing_head.getnext()
+
             html.append(body)
 
-        if self.canonical_url and not head.xpath('./link[@rel="canonical"]'):
-            url = request.upath_info.strip('/')
-            url = request.uscript_name + ('/' if url else '') + url
-            head.append(h.head.link(rel='canonical', href=url))
+        if skeleton is not None:
+            html_attrib, head_attrib, skeleton_head, skeleton_bottom = skeleton
+            for name, value in html_attrib.items():
+                if name not in html.attrib:
+                    html.set(name, value)
+
+            head.attrib.update({**head_attrib, **head.attrib})
+            head[:0] = copy.deepcopy(skeleton_head)
+            bottom = list(bottom) + copy.deepcopy(skeleton_bottom)
+
+        if self.canonical_url and not CANONICAL_LINKS(head):
+            head.append(h.head.link(rel='canonical', href=self.get_canonical_url(request)))
 
         existing_head.attrib.update(head.attrib)
         existing_head(head[:])
@@ -67,6 +338,110 @@ class PresentationService(plugin.Plugin):
 
         return root
 
+    def get_skeleton_parts(self, app):
+        """Static parts declared by ``app.render_skeleton()``, for the pages that can't use the serialized skeleton.
+
+        Returns:
+            the ``<html>`` attributes, the ``<head>`` attributes, the head entries and the bottom
+            entries, or ``None``
+        """
+        parts = self.skeleton_parts.get(app, ())
+        if parts == ():
+            render_skeleton = getattr(app, 'render_skeleton', None)
+            if render_skeleton is None:
+                parts = None
+            else:
+                h = app.create_renderer()
+                html = render_skeleton(h)
+                head = h.head.render_top()
+                parts = (dict(html.attrib), dict(head.attrib), head[:], list(h.head.render_bottom()))
+
+            self.skeleton_parts[app] = parts
+
+        return parts
+
+    def create_skeleton(self, app, encoding, doctype):
+        """Serialize once the static parts of the pages declared by ``app.render_skeleton()``.
+
+        Returns:
+            the bytes before the dynamic head entries, between them and the body content,
+            and after the body content, or ``None``
+        """
+        render_skeleton = getattr(app, 'render_skeleton', None)
+        if render_skeleton is None:
+            return None
+
+        h = app.create_renderer()
+        html = render_skeleton(h)
+        head = h.head.render_top()
+
+        html(
+            h.head.head(head[:], etree.ProcessingInstruction('nagare-skeleton'), **dict(head.attrib)),
+            h.body(etree.ProcessingInstruction('nagare-skeleton'), h.head.render_bottom()),
+        )
+
+        skeleton = SKELETON_MARKERS.split(self.serialize(html, encoding, doctype))
+
+        return skeleton if len(skeleton) == 3 else None
+
+    def serialize_with_skeleton(self, app, request, h, head, bottom, body, encoding, doctype):
+        """Only serialize the dynamic head entries and the body content between the skeleton parts.
+
+        Returns:
+            the body, possibly converted to a list, and the chunks of the page or ``None`` if
+            there is no skeleton or if the body is not a fragment
+        """
+        key = (app, encoding, doctype)
+        skeleton = self.skeletons.get(key, ())
+        if skeleton == ():
+            skeleton = self.skeletons[key] = self.create_skeleton(app, encoding, doctype)
+
+        nodes = list(body) if isinstance(body, SEQUENCES) else [body]
+        if (
+            (skeleton is None)
+            or head.attrib
+            or any(isinstance(node, etree.ElementBase) and node.tag in ('html', 'head', 'body') for node in nodes)
+        ):
+            return nodes, None
+
+        if self.canonical_url and not CANONICAL_LINKS(head):
+            head.append(h.head.link(rel='canonical', href=self.get_canonical_url(request)))
+
+        if self.minify:
+            self.minify_tree(head)
+            nodes = self.minify_tree(nodes)
+
+        before_head, before_body, after_body = skeleton
+
+        return nodes, [
+            before_head,
+            self.serialize_sequence(head[:], encoding),
+            before_body,
+            self.serialize_sequence(nodes + list(bottom), encoding),
+            after_body,
+        ]
+
+    @classmethod
+    def minify_tree(cls, output):
+        """Collapse the whitespaces of the texts outside of the ``PRESERVED_TAGS`` elements.
+
+        The elements are minified in place. The strings of a sequence can't be, so a sequence
+        is returned as a new list.
+        """
+        if isinstance(output, SEQUENCES):
+            return [WHITESPACES.sub(' ', node) if isinstance(node, str) else cls.minify_tree(node) for node in output]
+
+        if isinstance(output, etree._Element):
+            preserved = {node for element in output.iter(*PRESERVED_TAGS) for node in element.iter()}
+            for node in output.iter():
+                if node.text and isinstance(node.tag, str) and (node not in preserved):
+                    node.text = WHITESPACES.sub(' ', node.text)
+
+                if node.tail and (node.getparent() not in preserved):
+                    node.tail = WHITESPACES.sub(' ', node.tail)
+
+        return output
+
     def serialize(self, output, encoding='utf-8', doctype=None, pretty_print=False):
         if isinstance(output, etree.ElementBase):
             output.attrib.pop('xmlns', None)
@@ -75,46 +450,709 @@ class PresentationService(plugin.Plugin):
         elif isinstance(output, str):
             output = output.encode(encoding)
 
-        elif isinstance(output, (list, tuple, types.GeneratorType)):
-            elements = list(output)
-            with_doctype = any(isinstance(element, (etree.ElementBase, etree._Element)) for element in elements)
-            output = ((doctype + '\n') if doctype and with_doctype else '').encode(encoding)
-            output += b''.join(self.serialize(element, encoding) for element in elements)
+        elif isinstance(output, SEQUENCES):
+            output = self.serialize_sequence(output, encoding, doctype)
 
         elif isinstance(output, etree._Element):
             output = etree.tostring(output, encoding=encoding, pretty_print=pretty_print, doctype=doctype)
 
         return output
 
+    def serialize_fragment(self, output, encoding='utf-8'):
+        return self.serialize(self.minify_tree(output) if self.minify else output, encoding)
+
+    def serialize_sequence(self, output, encoding='utf-8', doctype=None):
+        """Serialize a possibly nested sequence of nodes in one pass.
+
+        The doctype is only prepended if a top level node is an element.
+        """
+        chunks = [b'']
+        with_doctype = False
+
+        iterators = [iter(output)]
+        while iterators:
+            for element in iterators[-1]:
+                if isinstance(element, SEQUENCES):
+                    iterators.append(iter(element))
+                    break
+
+                if isinstance(element, etree.ElementBase):
+                    element.attrib.pop('xmlns', None)
+                    element = element.tostring(encoding=encoding)
+                    with_doctype |= len(iterators) == 1
+                elif isinstance(element, str):
+                    element = element.encode(encoding)
+                elif isinstance(element, etree._Element):
+                    element = etree.tostring(element, encoding=encoding)
+                    with_doctype |= len(iterators) == 1
+
+                chunks.append(element)
+            else:
+                iterators.pop()
+
+        if doctype and with_doctype:
+            chunks[0] = (doctype + '\n').encode(encoding)
+
+        return b''.join(chunks)
+
+    @staticmethod
+    def drain(buffer):
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        return chunk
+
+    def stream(self, html, encoding='utf-8', doctype=None, pretty_print=False, tail=None):
+        """Incrementally serialize a ``<html>`` tree.
+
+        The doctype, the ``<html>`` start tag and all the nodes before ``<body>`` are
+        flushed first, then the ``<body>`` children by chunks of at least ``chunk_size`` bytes,
+        then the ``tail`` chunks, before the ``<body>`` end tag.
+        """
+        html.attrib.pop('xmlns', None)
+
+        buffer = io.BytesIO()
+        with etree.htmlfile(buffer, encoding=encoding, buffered=False) as f:
+            if doctype:
+                f.write_doctype(doctype)
+
+            with f.element(html.tag, html.attrib):
+                if html.text:
+                    f.write(html.text)
+
+                for child in html:
+                    if child.tag != 'body':
+                        f.write(child, pretty_print=pretty_print)
+                        continue
+
+                    yield self.drain(buffer)
+
+                    with f.element(child.tag, child.attrib):
+                        if child.text:
+                            f.write(child.text)
+
+                        for element in child:
+                            f.write(element, pretty_print=pretty_print)
+                            if buffer.tell() >= self.chunk_size:
+                                yield self.drain(buffer)
+
+                        if tail is not None:
+                            yield self.drain(buffer)
+                            yield from tail
+
+                    if child.tail:
+                        f.write(child.tail)
+
+        yield self.drain(buffer)
+
+    def create_cache_key(self, request):
+        """Key of the request in the cache, ``None`` if its response can't be shared.
+
+        The requests with credentials are not cached: a page personalised from a session cookie
+        doesn't always set a cookie in its response. Add ``Cookie`` to ``vary`` to cache the
+        pages per cookie value. The scheme and the host are part of the key, so that the virtual
+        hosts of an application don't share their pages.
+        """
+        if (request.method not in ('GET', 'HEAD')) or ('Authorization' in request.headers):
+            return None
+
+        if ('Cookie' in request.headers) and ('cookie' not in {header.lower() for header in self.cache_vary}):
+            return None
+
+        headers = tuple(request.headers.get(header, '') for header in self.cache_vary)
+
+        return (
+            request.host_url,
+            request.script_name,
+            request.path_info,
+            request.query_string,
+            request.is_xhr,
+        ) + headers
+
+    @staticmethod
+    def create_cache_entry(response):
+        from nagare.server import mvc_cache
+
+        return mvc_cache.CachedResponse.from_response(response)
+
+    def get_cache_ttl(self, request, response):
+        """Time to live of the response in the cache, ``0`` if it can't be cached.
+
+        The views can opt in or out by setting ``response.cache_ttl`` to a number of seconds
+        or ``0``, else the ``default`` policy and ``ttl`` of the configuration are used.
+        """
+        ttl = getattr(response, 'cache_ttl', None)
+        if ttl is None:
+            ttl = self.cache.ttl if self.cache_default else 0
+
+        if (
+            not ttl
+            or (request.method != 'GET')
+            or (response.status_code != 200)
+            or ('Set-Cookie' in response.headers)
+            or response.cache_control.no_store
+            or response.cache_control.private
+            or not isinstance(response.app_iter, list)
+        ):
+            return 0
+
+        if not {header.lower() for header in response.vary or ()} <= {header.lower() for header in self.cache_vary}:
+            return 0
+
+        if self.cache_vary:
+            response.vary = self.cache_vary
+
+        return ttl
+
+    @staticmethod
+    def create_etag(data):
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def get_version_etag(self, app, request, **params):
+        """ETag from the cheap version key the application can compute before any rendering."""
+        get_version_key = getattr(app, 'get_version_key', None)
+        version = get_version_key(request, **params) if get_version_key is not None else None
+
+        return None if version is None else self.create_etag(repr(version).encode('utf-8'))
+
+    @staticmethod
+    def set_not_modified(response, etag=None):
+        response.status_code = 304
+        response.app_iter = []
+        response.content_length = None
+        if etag is not None:
+            response.etag = etag
+
+        return response
+
+    def get_early_hints(self, app, request, **params):
+        """Preload links of the view, known from a previous rendering, to send in a ``103`` response.
+
+        A server can call it before handling the request, to send the ``103`` response before the
+        rendering starts. Only the ASGI adapter sends it: a WSGI server can't send an informational
+        response, so the links only reach the browser in the ``Link`` header of the final response.
+        """
+        if self.preloads is None:
+            return ()
+
+        get_preload_key = getattr(app, 'get_preload_key', None)
+        key = get_preload_key(request, **params) if get_preload_key is not None else None
+        if key is None:
+            return ()
+
+        key = request.environ['nagare.preload_key'] = (app, key)
+
+        entry = self.preloads.get(key) if self.early_hints else None
+        return entry.links if entry is not None else ()
+
+    def send_early_hints(self, app, request, **params):
+        """Send the preload links of the view, known from a previous rendering, in a ``103`` response.
+
+        The server must put a ``nagare.early_hints(links)`` callable in the request environment.
+        """
+        links = self.get_early_hints(app, request, **params)
+
+        send_early_hints = request.environ.get('nagare.early_hints')
+        if links and (send_early_hints is not None):
+            send_early_hints(links)
+
+    def set_preload_links(self, request, response, head, bottom, skeleton=None):
+        """Add the ``Link`` header preloading the stylesheets and the scripts of the page.
+
+        Args:
+            request: the request, with the preload key of its view in its environment
+            response: the response of the page
+            head: the head entries of the page
+            bottom: the bottom entries of the page
+            skeleton: the static parts of the pages, from ``get_skeleton_parts()``, or ``None``
+        """
+        key = request.environ.get('nagare.preload_key')
+        entry = self.preloads.get(key) if key is not None else None
+        if entry is None:
+            from nagare.server import mvc_hints
+
+            nodes = [head, *bottom]
+            if skeleton is not None:
+                _, _, skeleton_head, skeleton_bottom = skeleton
+                nodes = [*skeleton_head, *nodes, *skeleton_bottom]
+
+            entry = mvc_hints.CachedLinks(mvc_hints.create_preload_links(nodes))
+            if key is not None:
+                self.preloads.set(key, entry)
+
+        if entry.links:
+            response.headers.add('Link', ', '.join(entry.links))
+
+    def get_content_encoding(self, request):
+        if 'Accept-Encoding' not in request.headers:
+            return None
+
+        offers = request.accept_encoding.acceptable_offers(self.compression_encodings)
+
+        return offers[0][0] if offers else None
+
+    def create_compressor(self, encoding):
+        return zlib.compressobj(self.compression_level, zlib.DEFLATED, COMPRESSION_WBITS[encoding])
+
+    def compress_chunks(self, chunks, encoding):
+        compressor = self.create_compressor(encoding)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressor.flush()
+
+    async def compress_async_chunks(self, chunks, encoding):
+        compressor = self.create_compressor(encoding)
+        async for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressor.flush()
+
+    def compress(self, response, encoding):
+        """Encode the body of a compressible response.
+
+        Streamed bodies, and bodies of unknown length, are compressed chunk by chunk, without size threshold.
+
+        Returns:
+            ``True`` if a complete body was compressed
+        """
+        if (response.status_code != 200) or (response.content_type not in self.compression_types):
+            return False
+
+        if 'Accept-Encoding' not in (response.vary or ()):
+            response.vary = (response.vary or ()) + ('Accept-Encoding',)
+
+        if (encoding is None) or response.content_encoding:
+            return False
+
+        if hasattr(response.app_iter, '__aiter__'):
+            response.app_iter = self.compress_async_chunks(response.app_iter, encoding)
+            compressed = False
+        elif not isinstance(response.app_iter, list) or (response.content_length is None):
+            response.app_iter = self.compress_chunks(response.app_iter, encoding)
+            compressed = False
+        elif response.content_length >= self.compression_min_size:
+            compressor = self.create_compressor(encoding)
+            response.body = compressor.compress(response.body) + compressor.flush()
+            compressed = True
+        else:
+            return False
+
+        response.content_encoding = encoding
+        if response.etag:
+            response.etag = response.etag + '-' + encoding
+
+        return compressed
+
+    def process_request(self, app, request, response, **params):
+        """Steps of the request handling around the rendering of the response.
+
+        This generator yields the timings recorder when a response must be rendered then receives
+        it, so that it's shared by the synchronous and asynchronous request handling.
+        """
+        if self.timing:
+            timings = mvc_metrics.MemoryTimings() if self.timing_memory else mvc_metrics.Timings()
+        else:
+            timings = mvc_metrics.NULL_TIMINGS
+
+        try:
+            encoding = self.get_content_encoding(request) if self.compression else None
+
+            etag = self.get_version_etag(app, request, **params) if self.etag else None
+            if etag is not None:
+                for candidate in (etag, etag + '-' + encoding) if encoding else (etag,):
+                    if candidate in request.if_none_match:
+                        if self.compression:
+                            response.vary = ('Accept-Encoding',)  # As the rendered response would
+
+                        return self.set_not_modified(response, candidate)
+
+            key = self.create_cache_key(request) if self.cache is not None else None
+            entry, flight = self.lookup_cache(key, encoding) if key is not None else (None, False)
+            if key is not None:
+                timings.mark('cache')
+
+            if entry is not None:
+                response = entry.to_response(response)
+                ttl = entry.ttl
+            else:
+                if self.preloads is not None:
+                    self.send_early_hints(app, request, **params)
+
+                try:
+                    response = yield timings
+
+                    if self.etag and (response.status_code == 200) and isinstance(response.app_iter, list):
+                        response.etag = etag or self.create_etag(response.body)
+
+                    ttl = self.get_cache_ttl(request, response) if key is not None else 0
+                    if ttl:
+                        ttl += self.cache_stale
+                        self.cache.set(key, self.create_cache_entry(response), ttl)
+                finally:
+                    if flight:
+                        self.end_flight(key)
+
+            if self.compression and self.compress(response, encoding):
+                timings.mark('compression', response.content_length)
+                if ttl > 0:
+                    self.cache.set(key + (encoding,), self.create_cache_entry(response), ttl)
+
+            if (
+                self.etag
+                and (response.status_code == 200)
+                and response.etag
+                and (response.etag in request.if_none_match)
+            ):
+                response = self.set_not_modified(response)
+
+            if self.timing:
+                self.report_timings(request, response, timings)
+
+            return response
+        finally:
+            timings.stop()
+
     def handle_request(self, chain, app, request, response, render=None, **params):
+        """Render the response, or return a coroutine when the views are asynchronous."""
         if not request.path_info:
             raise request.create_redirect_response()
 
-        h = app.create_renderer(request=request, response=response, **params)
+        steps = self.process_request(app, request, response, **params)
+        try:
+            timings = next(steps)
+
+            response = self.create_response(chain, app, request, response, render, timings, **params)
+            if is_awaitable(response):
+                completion = self.complete_async_request(steps, response)
+                weakref.finalize(completion, steps.close)  # Ends the cache flight even if never awaited
+
+                return completion
+
+            steps.send(response)
+        except StopIteration as result:
+            return result.value
+        except BaseException:
+            steps.close()
+            raise
+
+    @staticmethod
+    async def complete_async_request(steps, response):
+        try:
+            steps.send(await response)
+        except StopIteration as result:
+            return result.value
+        except BaseException:
+            steps.close()
+            raise
+
+    def get_cached_response(self, key, encoding):
+        """Cached encoded response of ``key`` or, if missing or stale, its identity response."""
+        entry = self.cache.get(key + (encoding,)) if encoding else None
+        if (entry is None) or (entry.ttl <= self.cache_stale):
+            entry = self.cache.get(key) or entry
+
+        return entry
+
+    def lookup_cache(self, key, encoding):
+        """Look for the cached response of ``key``, preferably already encoded.
+
+        With ``stale``, an entry in the last ``stale`` seconds of its life is still served while a
+        request renders the page again. With ``coalescing``, a request for a page being rendered waits
+        for it instead of rendering it too. Only one request renders a page at a time, per process.
+
+        Returns:
+            the entry, or ``None`` if the page must be rendered, and if this request renders it for all
+        """
+        entry = self.get_cached_response(key, encoding)
+        if (entry is not None) and (entry.ttl > self.cache_stale):
+            return entry, False
+
+        if (entry is None) and not self.cache_coalescing:
+            return None, False
+
+        with self.flights_lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                self.flights[key] = threading.Event()
+                return None, True
+
+        # A request of an event loop can't block, it renders the page itself
+        if (entry is None) and not in_event_loop():
+            flight.wait(self.cache_coalescing_timeout)
+            entry = self.get_cached_response(key, encoding)
+
+        return entry, False
+
+    def end_flight(self, key):
+        with self.flights_lock:
+            self.flights.pop(key).set()
+
+    def report_timings(self, request, response, timings):
+        if self.server_timing:
+            response.headers['Server-Timing'] = timings.to_header()
+
+        for callback in self.metrics_callbacks:
+            callback(request, response, timings)
+
+    def create_response(self, chain, app, request, response, render=None, timings=mvc_metrics.NULL_TIMINGS, **params):
+        create_renderer = getattr(app, 'create_xhr_renderer', None) if self.is_xhr_fast_path(request) else None
+        h = (create_renderer or app.create_renderer)(request=request, response=response, **params)
+        if self.fragments is not None:
+            from nagare.server import mvc_fragments
+
+            h.fragments = mvc_fragments.Fragments(h, self.fragments, self.serialize_fragment)
+        if self.deferred is not None:
+            from nagare.server import mvc_deferred
+
+            h.deferred = mvc_deferred.DeferredFragments(
+                lambda: app.create_renderer(request=request, response=response, **params),
+                self.deferred,
+                self.deferred_timeout,
+                lambda fragment_h: self.release_renderer(app, fragment_h),
+            )
+
         response = chain.next(app=app, request=request, response=response, renderer=h, **params)
+        body = None if is_awaitable(response) else self.render_body(response, h, render)
+        if is_awaitable(response) or is_awaitable(body) or ((self.deferred is not None) and h.deferred.is_async):
+            return self.create_async_response(app, request, response, h, render, body, timings)
+
+        timings.mark('view')
+
+        if (self.deferred is not None) and h.deferred.fragments and not self.is_out_of_order(request, response):
+            body = h.deferred.assemble(body)
+            timings.mark('deferred')
+
+        return self.serialize_response(app, request, response, h, body, timings)
+
+    async def create_async_response(self, app, request, response, h, render, body, timings):
+        if is_awaitable(response):
+            response = await response
+            body = self.render_body(response, h, render)
+
+        if is_awaitable(body):
+            body = await body
+        timings.mark('view')
+
+        if (self.deferred is not None) and h.deferred.fragments:
+            body = await h.deferred.assemble_async(body)
+            timings.mark('deferred')
+
+        if self.is_large(body):
+            return await self.offload.run_async(
+                timings, self.serialize_response, app, request, response, h, body, timings
+            )
+
+        return self.serialize_response(app, request, response, h, body, timings)
+
+    def is_out_of_order(self, request, response):
+        """Check if the deferred fragments of a synchronous request are streamed after the rest of the page."""
+        return (
+            self.deferred_out_of_order and self.streaming and not request.is_xhr and ('html' in response.content_type)
+        )
+
+    def is_large(self, body):
+        """Check if the serialization of ``body``, by an asynchronous request, must be done in the offload workers.
+
+        Only the event loop benefits from the offload: a synchronous request would block its own
+        thread waiting for a worker, without freeing any. Streamed bodies are serialized lazily,
+        by the server, so they are never offloaded.
+        """
+        return (
+            (self.offload is not None)
+            and not self.streaming
+            and isinstance(body, (etree._Element, list, tuple))
+            and mvc_offload.count_reaches(body, self.offload_min_elements)
+        )
+
+    @staticmethod
+    def render_body(response, h, render):
         if not (200 <= response.status_code < 300):
             return response
 
         response.content_type = h.content_type
         response.doctype = h.doctype
 
-        body = render(h) if render else (response if response.body or response.text else h.root)
+        return render(h) if render else (response if response.body or response.text else h.root)
+
+    def serialize_response(self, app, request, response, h, body, timings):
         if isinstance(body, Response):
             return body
 
         if not (200 <= response.status_code < 300):
             return response
 
+        streaming = self.check_elements(body)
+
+        if self.is_xhr_fast_path(request):
+            return self.serialize_xhr(app, response, h, body, timings)
+
+        encoding = response.charset or response.default_body_encoding
+        doctype = response.doctype if not request.is_xhr else None
+        chunks = None
+        out_of_order = (self.deferred is not None) and bool(h.deferred.fragments)
+        declared = set()
+
         if not request.is_xhr and ('html' in response.content_type):
-            body = self.merge_head(request, h, h.head.render_top(), h.head.render_bottom(), body)
+            head, bottom = h.head.render_top(), h.head.render_bottom()
+            if (self.deferred is not None) and (h.deferred.head or h.deferred.bottom):
+                bottom = self.add_head_entries(head, bottom, h.deferred.head, h.deferred.bottom)
+            if self.preloads is not None:
+                bottom = list(bottom)
+                skeleton = self.get_skeleton_parts(app) if self.skeleton else None
+                self.set_preload_links(request, response, head, bottom, skeleton)
+            if out_of_order:
+                from nagare.server import mvc_deferred
+
+                body = h.deferred.set_markers(h, body)
+                bottom = list(bottom) + [h.script(mvc_deferred.SWAP_SCRIPT)]
+                declared = {etree.tostring(entry) for entry in itertools.chain(head, bottom)}
+            timings.mark('head')
+
+            if self.skeleton:
+                body, chunks = self.serialize_with_skeleton(app, request, h, head, bottom, body, encoding, doctype)
+
+            if chunks is None:
+                skeleton = self.get_skeleton_parts(app) if self.skeleton else None
+                body = self.merge_head(request, h, head, bottom, body, skeleton)
+                timings.mark('merge_head')
+
             if self.frame_options:
                 response.headers.setdefault('X-Frame-Options', self.frame_options)
 
-        response.body = self.serialize(
-            body,
-            encoding=response.charset or response.default_body_encoding,
-            doctype=response.doctype if not request.is_xhr else None,
-            pretty_print=True,
-        )
+        if self.minify and (chunks is None):
+            body = self.minify_tree(body)
+            timings.mark('minify')
+
+        if out_of_order:
+            tail = h.deferred.stream(self.serialize_fragment, encoding, declared)
+            if chunks is not None:
+                chunks = itertools.chain(chunks[:-1], tail, chunks[-1:])
+            elif isinstance(body, etree._Element) and (body.tag == 'html'):
+                chunks = self.stream(body, encoding, doctype, self.pretty_print, tail)
+            else:
+                chunks = itertools.chain([self.serialize(body, encoding, doctype, self.pretty_print)], tail)
+
+        if streaming and (chunks is None) and isinstance(body, etree._Element) and (body.tag == 'html'):
+            chunks = self.stream(body, encoding, doctype, self.pretty_print)
+
+        if streaming and (chunks is not None):
+            if self.fragments is not None:
+                chunks = (h.fragments.splice(chunk, encoding) for chunk in chunks)
+
+            chunks = self.limit_chunks(chunks) if self.max_size else chunks
+            response.app_iter = self.release_after(app, h, chunks)
+        else:
+            body = (
+                b''.join(chunks) if chunks is not None else self.serialize(body, encoding, doctype, self.pretty_print)
+            )
+            if self.fragments is not None:
+                body = h.fragments.splice(body, encoding)
+
+            response.body = self.check_size(body)
+            timings.mark('serialize', response.content_length)
+
+            self.release_renderer(app, h)
+
+        return response
+
+    @staticmethod
+    def add_head_entries(head, bottom, fragments_head, fragments_bottom):
+        """Add the head entries of the deferred fragments not already declared in the page.
+
+        Returns:
+            the new bottom entries
+        """
+        from nagare.server import mvc_deferred
+
+        declared = {etree.tostring(entry) for entry in itertools.chain(head, bottom)}
+
+        head.extend(mvc_deferred.filter_declared(fragments_head, declared))
+        return list(bottom) + list(mvc_deferred.filter_declared(fragments_bottom, declared))
+
+    @staticmethod
+    def create_limit_error(limit):
+        from webob import exc
+
+        return exc.HTTPInternalServerError('Response limit exceeded: {}'.format(limit))
+
+    def check_elements(self, body):
+        """Check the number of elements of the body against the limits.
+
+        Raises:
+            HTTPInternalServerError: above ``max_elements`` elements
+
+        Returns:
+            ``True`` if the page must be streamed
+        """
+        if not isinstance(body, (etree._Element, list, tuple)):
+            return self.streaming
+
+        if self.max_elements and mvc_offload.count_reaches(body, self.max_elements + 1):
+            raise self.create_limit_error('more than {} elements'.format(self.max_elements))
+
+        return self.streaming or (self.stream_elements > 0 and mvc_offload.count_reaches(body, self.stream_elements))
+
+    def check_size(self, body):
+        if self.max_size and (len(body) > self.max_size):
+            raise self.create_limit_error('more than {} bytes'.format(self.max_size))
+
+        return body
+
+    def limit_chunks(self, chunks):
+        """Abort a streamed response above ``max_size`` bytes, its status being already sent."""
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size > self.max_size:
+                raise self.create_limit_error('more than {} bytes'.format(self.max_size))
+
+            yield chunk
+
+    def is_xhr_fast_path(self, request):
+        return self.xhr_fast_path and request.is_xhr
+
+    def release_after(self, app, h, chunks):
+        """Give back the renderer once the streamed chunks are all sent, or the response closed."""
+        try:
+            yield from chunks
+        finally:
+            self.release_renderer(app, h)
+
+    @staticmethod
+    def release_renderer(app, h):
+        release_renderer = getattr(app, 'release_renderer', None)
+        if release_renderer is not None:
+            release_renderer(h)
+
+    def serialize_xhr(self, app, response, h, body, timings):
+        """Directly serialize the nodes of a XHR response, without any head processing.
+
+        A dictionary of nodes, keyed by component id, is serialized as a JSON object of HTML fragments.
+        """
+        if isinstance(body, dict):
+            fragments = {}
+            for component_id, nodes in body.items():
+                fragment = self.serialize_fragment(nodes, 'utf-8')
+                if self.fragments is not None:
+                    fragment = h.fragments.splice(fragment)
+
+                fragments[component_id] = fragment.decode('utf-8')
+
+            response.content_type = 'application/json'
+            response.charset = 'utf-8'
+            response.body = self.check_size(json.dumps(fragments).encode('utf-8'))
+        else:
+            encoding = response.charset or response.default_body_encoding
+
+            body = self.serialize_fragment(body, encoding)
+            if self.fragments is not None:
+                body = h.fragments.splice(body, encoding)
+
+            response.body = self.check_size(body)
+
+        timings.mark('serialize', response.content_length)
+        self.release_renderer(app, h)
 
         return response
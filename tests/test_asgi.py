@@ -0,0 +1,210 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import asyncio
+
+from webob import exc
+
+from nagare.server import mvc_asgi, mvc_application
+from nagare.services import presentation
+
+
+def call(handle, path='/a', query_string=b'', headers=(), body=b'', method='POST'):
+    messages = [
+        {'type': 'http.request', 'body': body[:2], 'more_body': True},
+        {'type': 'http.request', 'body': body[2:]},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'headers': list(headers)}
+    asyncio.run(mvc_asgi.ASGIAdapter(handle)(scope, receive, send))
+
+    start, *chunks = sent
+    assert chunks[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+
+    return start['status'], dict(start['headers']), [chunk['body'] for chunk in chunks[:-1]]
+
+
+def test_environ():
+    environ = mvc_asgi.create_environ(
+        {
+            'method': 'GET',
+            'path': '/é',
+            'root_path': '/app',
+            'query_string': b'x=1',
+            'headers': [(b'content-type', b'text/plain'), (b'accept', b'text/html'), (b'accept', b'*/*')],
+        },
+        b'',
+    )
+
+    assert environ['SCRIPT_NAME'] == '/app'
+    assert environ['PATH_INFO'] == '/\xc3\xa9'
+    assert environ['QUERY_STRING'] == 'x=1'
+    assert environ['CONTENT_TYPE'] == 'text/plain'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+
+
+def test_sync_handle():
+    def handle(request, response):
+        response.text = '{} {} {}'.format(request.path_info, request.GET['x'], request.body.decode())
+        return response
+
+    status, headers, chunks = call(handle, query_string=b'x=1', body=b'hello')
+    assert status == 200
+    assert headers[b'Content-Length'] == b'10'
+    assert chunks == [b'/a 1 hello']
+
+
+def test_async_handle():
+    async def chunks():
+        for chunk in (b'hello', b' world'):
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def handle(request, response):
+        await asyncio.sleep(0)
+        response.app_iter = chunks()
+        return response
+
+    assert call(handle)[2] == [b'hello', b' world']
+
+
+def test_http_exception():
+    def handle(request, response):
+        raise exc.HTTPMovedPermanently(location='/a/')
+
+    status, headers, _ = call(handle)
+    assert status == 301
+    assert headers[b'Location'].endswith(b'/a/')
+
+
+def test_concurrency():
+    async def handle(request, response):
+        await asyncio.sleep(0.05)
+        response.text = request.path_info
+        return response
+
+    adapter = mvc_asgi.ASGIAdapter(handle)
+
+    async def request(path):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        await adapter({'type': 'http', 'method': 'GET', 'path': path}, receive, send)
+
+        return sent[1]['body']
+
+    async def requests():
+        return await asyncio.wait_for(asyncio.gather(*[request('/{}'.format(i)) for i in range(20)]), 0.5)
+
+    assert asyncio.run(requests()) == ['/{}'.format(i).encode() for i in range(20)]
+
+
+def test_early_hints():
+    async def handle(request, response):
+        request.environ['nagare.early_hints'](['</a.css>; rel=preload; as=style'])
+        await asyncio.sleep(0)
+        return response
+
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'extensions': {'http.response.early_hint': {}}}
+    asyncio.run(mvc_asgi.ASGIAdapter(handle)(scope, receive, send))
+
+    assert sent[0] == {'type': 'http.response.early_hint', 'links': [b'</a.css>; rel=preload; as=style']}
+    assert sent[1]['type'] == 'http.response.start'
+
+
+def test_early_hints_before_handle():
+    sent = []
+
+    def handle(request, response):
+        assert sent == [{'type': 'http.response.early_hint', 'links': [b'</%C3%A9.css>; rel=preload; as=style']}]
+        assert 'nagare.early_hints' not in request.environ
+        return response
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    adapter = mvc_asgi.ASGIAdapter(handle, get_early_hints=lambda request: ['</%C3%A9.css>; rel=preload; as=style'])
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'extensions': {'http.response.early_hint': {}}}
+    asyncio.run(adapter(scope, receive, send))
+
+    assert [message['type'] for message in sent] == [
+        'http.response.early_hint',
+        'http.response.start',
+        'http.response.body',
+        'http.response.body',
+    ]
+
+
+class AsyncApp(mvc_application.AsyncApp):
+    def __init__(self):
+        self.static_url = '/static'
+        self.renderers = None
+
+
+class Chain:
+    def __init__(self, app):
+        self.app = app
+        self.calls = 0
+
+    def next(self, renderer, response, **params):
+        async def view():
+            self.calls += 1
+            await asyncio.sleep(0)
+            renderer << renderer.html(renderer.body([renderer.p(str(i)) for i in range(10)]))
+            response.cache_ttl = 60
+
+            return renderer.root
+
+        return self.app.set_response_body(response, view())
+
+
+def test_presentation():
+    app = AsyncApp()
+    chain = Chain(app)
+    p = presentation.PresentationService(
+        None, None, False, cache={'activated': True}, offload={'activated': True, 'min_elements': 10}
+    )
+
+    def handle(request, response):
+        return p.handle_request(chain, app, request, response)
+
+    for _ in range(2):
+        status, headers, chunks = call(handle, method='GET')
+
+        assert status == 200
+        assert headers[b'Content-Type'].startswith(b'text/html')
+        assert b''.join(chunks).endswith(
+            b'<body><p>0</p><p>1</p><p>2</p><p>3</p><p>4</p><p>5</p><p>6</p><p>7</p><p>8</p><p>9</p></body></html>'
+        )
+
+    assert chain.calls == 1  # The second response comes from the cache
+    assert p.offload.report()['submitted'] == 1
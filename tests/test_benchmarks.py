@@ -0,0 +1,94 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import pytest
+import webob
+
+from nagare.server import mvc_application
+from nagare.services import presentation
+from nagare.renderers import html_base as html
+
+pytest.importorskip('pytest_benchmark')
+
+
+def create_page(nb_items=100):
+    h = html.Renderer()
+    h.head << h.head.title('Benchmark')
+    h.head.javascript_url('/foo.js')
+
+    with h.html(id='html'):
+        h << h.head.head(h.head.title, id='head')
+        with h.body(id='body'):
+            h << h.comment('items')
+            with h.ul('\n  '):
+                for i in range(nb_items):
+                    h << h.li('\n    ', h.a('item   %d' % i, href='/items/%d' % i), '\n  ')
+            h << h.pre('  preformatted\n    text  ')
+
+    return h
+
+
+def serialize(p, pretty_print=False, minify=False):
+    h = create_page()
+    r = webob.Request({'PATH_INFO': '/a', 'SCRIPT_NAME': '/b'})
+    page = p.merge_head(r, h, h.head.render_top(), h.head.render_bottom(), h.root)
+    if minify:
+        page = p.minify_tree(page)
+
+    return p.serialize(page, 'utf-8', '<!DOCTYPE html>', pretty_print)
+
+
+@pytest.mark.parametrize('pretty_print, minify', [(True, False), (False, False), (False, True)])
+def test_serialize(benchmark, pretty_print, minify):
+    p = presentation.PresentationService(None, None, False)
+
+    output = benchmark(serialize, p, pretty_print, minify)
+    benchmark.extra_info['size'] = len(output)
+
+    assert len(output) <= len(serialize(p, True, False))
+
+
+MERGE_HEAD_SHAPES = {
+    'fragment': lambda h: h << h.comment('c1') << h.p('hello') << h.comment('c2'),
+    'body': lambda h: h << h.comment('c1') << h.body(h.p('hello')) << h.comment('c2'),
+    'head': lambda h: h << h.comment('c1') << h.head.head << h.comment('c2') << h.p('hello') << h.comment('c3'),
+    'head_body': lambda h: h << h.comment('c1') << h.head.head << h.comment('c2') << h.body << h.comment('c3'),
+    'html': lambda h: h << h.html(h.head.head(h.head.title, id='head'), h.p('foo'), id='html'),
+    'html_body': lambda h: h << h.html(h.head.head(h.head.title), h.body(h.p('foo'), id='body'), id='html'),
+    'wrapped_html': lambda h: h << h.comment('c1') << h.html(h.p('foo')) << 'hello' << h.comment('c2'),
+}
+
+
+def merge_head(p, r, shape):
+    h = html.Renderer()
+    h.head.javascript_url('/foo.js')
+    MERGE_HEAD_SHAPES[shape](h)
+
+    return p.merge_head(r, h, h.head.render_top(), h.head.render_bottom(), h.root)
+
+
+@pytest.mark.parametrize('shape', MERGE_HEAD_SHAPES)
+def test_merge_head(benchmark, shape):
+    p = presentation.PresentationService(None, None, True)
+    r = webob.Request({'PATH_INFO': '/a', 'SCRIPT_NAME': '/b'})
+
+    benchmark(merge_head, p, r, shape)
+
+
+@pytest.mark.parametrize('pooled', [False, True])
+def test_create_renderer(benchmark, pooled):
+    pool = mvc_application.RendererPool(html.Renderer, int(pooled))
+
+    def create_renderer():
+        h = pool.acquire(static_url='/static')
+        h.head << h.head.title('Benchmark')
+        h << h.ul([h.li(h.a('item %d' % i, href='/items/%d' % i)) for i in range(100)])
+        pool.release(h)
+
+    benchmark(create_renderer)
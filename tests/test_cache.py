@@ -0,0 +1,246 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import gc
+import os
+import time
+import struct
+import threading
+
+import pytest
+import webob
+
+from nagare.server import mvc_cache
+from nagare.services import presentation
+
+
+def create_entry(body):
+    return mvc_cache.CachedResponse('200 OK', [('Content-Type', 'text/html')], body)
+
+
+@pytest.fixture(params=['memory', 'filesystem', 'shared'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return mvc_cache.MemoryCache(ttl=60, max_entries=3, max_size=10)
+
+    if request.param == 'shared':
+        return mvc_cache.SharedMemoryCache(str(tmp_path), ttl=60, max_entries=3, max_size=1000)
+
+    return mvc_cache.FileSystemCache(str(tmp_path), ttl=60, max_entries=3, max_size=1000)
+
+
+def test_get_set(cache):
+    assert cache.get(('/a',)) is None
+
+    cache.set(('/a',), create_entry(b'hello'))
+    entry = cache.get(('/a',))
+    assert entry[:3] == create_entry(b'hello')[:3]
+    assert 59 < entry.ttl <= 60
+
+    cache.set(('/a',), create_entry(b'world'), ttl=10)
+    entry = cache.get(('/a',))
+    assert entry[:3] == create_entry(b'world')[:3]
+    assert 9 < entry.ttl <= 10
+
+    cache.delete(('/a',))
+    assert cache.get(('/a',)) is None
+
+    cache.set(('/a',), create_entry(b'hello'))
+    cache.clear()
+    assert cache.get(('/a',)) is None
+
+
+def test_ttl(cache):
+    cache.set(('/a',), create_entry(b'hello'), ttl=-1)
+    assert cache.get(('/a',)) is None
+
+
+def test_lru(cache):
+    for i, path in enumerate(('/a', '/b', '/c')):
+        cache.set((path,), create_entry(b'x'))
+        time.sleep(0.01 * i)
+
+    assert cache.get(('/a',)) is not None
+    time.sleep(0.01)
+    cache.set(('/d',), create_entry(b'x'))
+
+    assert cache.get(('/a',)) is not None
+    assert cache.get(('/b',)) is None
+    assert cache.get(('/c',)) is not None
+    assert cache.get(('/d',)) is not None
+
+
+def test_max_size():
+    cache = mvc_cache.MemoryCache(max_size=10)
+
+    cache.set(('/a',), create_entry(b'x' * 11))
+    assert cache.get(('/a',)) is None
+
+    cache.set(('/a',), create_entry(b'x' * 6))
+    cache.set(('/b',), create_entry(b'x' * 6))
+    assert cache.get(('/a',)) is None
+    assert cache.get(('/b',)) is not None
+
+
+def test_response():
+    response = webob.Response(b'hello', content_type='text/plain')
+    entry = mvc_cache.CachedResponse.from_response(response)
+
+    response = entry.to_response(webob.Response())
+    assert response.status == '200 OK'
+    assert response.content_type == 'text/plain'
+    assert response.body == b'hello'
+
+
+def test_shared_between_processes(tmp_path):
+    cache = mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=16, max_size=16 * 1024)
+
+    pid = os.fork()
+    if pid == 0:
+        mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=16, max_size=16 * 1024).set(('/a',), create_entry(b'x'))
+        os._exit(0)
+
+    os.waitpid(pid, 0)
+    assert cache.get(('/a',))[:3] == create_entry(b'x')[:3]
+
+    cache.set(('/b',), create_entry(b'x' * 16 * 1024))
+    assert cache.get(('/b',)) is None
+
+
+def test_shared_interrupted_write(tmp_path):
+    cache = mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=16, max_size=16 * 1024)
+
+    for offset in cache.get_slots(cache.get_digest(('/a',))):
+        struct.pack_into('<Q', cache.memory, offset, 3)  # Odd sequence left by a dead writer
+
+    cache.set(('/a',), create_entry(b'x'))
+    assert cache.get(('/a',))[:3] == create_entry(b'x')[:3]
+
+    cache.set(('/a',), create_entry(b'y'))
+    assert cache.get(('/a',))[:3] == create_entry(b'y')[:3]
+
+    with pytest.raises(ValueError, match='max_entries'):
+        mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=0)
+
+
+def test_shared_namespace(tmp_path, caplog):
+    cache1 = mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=16, namespace='app1', slot_size=4096)
+    cache2 = mvc_cache.SharedMemoryCache(str(tmp_path), max_entries=16, namespace='app2', slot_size=4096)
+    assert sorted(os.listdir(tmp_path)) == ['nagare-mvc-cache-app1-16x4096', 'nagare-mvc-cache-app2-16x4096']
+
+    cache1.set(('/a',), create_entry(b'x'))
+    assert cache1.get(('/a',)) is not None
+    assert cache2.get(('/a',)) is None
+
+    cache1.set(('/b',), create_entry(b'x' * 4096))
+    assert cache1.get(('/b',)) is None
+    assert 'not cached' in caplog.text
+
+    offset = cache1.get_slots(cache1.get_digest(('/a',))).start
+    for slot in range(offset, offset + cache1.set_size, cache1.slot_size):
+        data = slot + cache1.SLOT_HEADER.size
+        cache1.memory[data : data + 8] = b'corrupt!'
+    assert cache1.get(('/a',)) is None
+
+
+def test_presentation_cache_policy():
+    p = presentation.PresentationService(
+        None, None, cache={'activated': True, 'default': False, 'vary': ['Accept-Language']}
+    )
+    assert isinstance(p.cache, mvc_cache.MemoryCache)
+
+    request = webob.Request.blank('/a?b=c', headers={'Accept-Language': 'fr'})
+    assert p.create_cache_key(request) == ('http://localhost', '', '/a', 'b=c', False, 'fr')
+    assert p.create_cache_key(webob.Request.blank('https://example.com/a?b=c'))[0] == 'https://example.com'
+    assert p.create_cache_key(webob.Request.blank('/a', method='POST')) is None
+    assert p.create_cache_key(webob.Request.blank('/a', headers={'Cookie': 'session=x'})) is None
+
+    response = webob.Response(b'hello')
+    assert p.get_cache_ttl(request, response) == 0
+
+    response.cache_ttl = 10
+    assert p.get_cache_ttl(request, response) == 10
+    assert response.vary == ('Accept-Language',)
+
+    response = webob.Response(b'hello', vary=('Cookie',))
+    response.cache_ttl = 10
+    assert p.get_cache_ttl(request, response) == 0
+
+    response = webob.Response(b'hello')
+    response.set_cookie('session', 'x')
+    response.cache_ttl = 10
+    assert p.get_cache_ttl(request, response) == 0
+
+
+def test_presentation_cache_stale():
+    p = presentation.PresentationService(None, None, cache={'activated': True, 'stale': 30})
+    key = ('', '/a', '', False)
+
+    p.cache.set(key, create_entry(b'hello'), 40)
+    entry, flight = p.lookup_cache(key, None)
+    assert (entry.body, flight) == (b'hello', False)
+
+    p.cache.set(key, create_entry(b'hello'), 20)
+    assert p.lookup_cache(key, None) == (None, True)
+
+    entry, flight = p.lookup_cache(key, None)
+    assert (entry.body, flight) == (b'hello', False)
+
+    p.end_flight(key)
+    assert not p.flights
+
+
+def test_presentation_cache_coalescing():
+    p = presentation.PresentationService(None, None, cache={'activated': True, 'coalescing': True})
+    key = ('', '/a', '', False)
+    assert p.lookup_cache(key, None) == (None, True)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(p.lookup_cache(key, None)))
+    waiter.start()
+    time.sleep(0.1)
+    assert not results
+
+    p.cache.set(key, create_entry(b'hello'), 10)
+    p.end_flight(key)
+    waiter.join()
+
+    entry, flight = results[0]
+    assert (entry.body, flight) == (b'hello', False)
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_presentation_cache_flight_not_awaited():
+    class App:
+        def create_renderer(self, **params):
+            return None
+
+    class Chain:
+        def next(self, renderer, response, **params):
+            async def render():
+                return response
+
+            return render()
+
+    p = presentation.PresentationService(None, None, cache={'activated': True, 'coalescing': True})
+
+    completion = p.handle_request(Chain(), App(), webob.Request.blank('/a'), webob.Response())
+    assert p.flights
+
+    completion.close()
+    del completion
+    gc.collect()
+    assert not p.flights
+
+
+def test_presentation_cache_cookie():
+    p = presentation.PresentationService(None, None, cache={'activated': True, 'vary': ['Accept-Language', 'Cookie']})
+
+    request = webob.Request.blank('/a', headers={'Cookie': 'session=x'})
+    assert p.create_cache_key(request) == ('http://localhost', '', '/a', '', False, '', 'session=x')
@@ -0,0 +1,98 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import gzip
+import zlib
+
+import webob
+
+from nagare.renderers import html5_base
+from nagare.services import presentation
+
+
+def create_presentation(**config):
+    return presentation.PresentationService(None, None, False, compression=dict(config, activated=True))
+
+
+def test_negotiation():
+    p = create_presentation()
+
+    assert p.get_content_encoding(webob.Request.blank('/')) is None
+    assert p.get_content_encoding(webob.Request.blank('/', headers={'Accept-Encoding': 'br'})) is None
+    assert p.get_content_encoding(webob.Request.blank('/', headers={'Accept-Encoding': 'deflate, gzip'})) == 'gzip'
+    assert p.get_content_encoding(webob.Request.blank('/', headers={'Accept-Encoding': 'gzip;q=0.5, deflate'})) == (
+        'deflate'
+    )
+
+    p = create_presentation(encodings=['deflate'])
+    assert p.get_content_encoding(webob.Request.blank('/', headers={'Accept-Encoding': 'gzip, deflate'})) == 'deflate'
+
+
+def test_compress():
+    p = create_presentation(min_size=100)
+
+    response = webob.Response(b'x' * 1000, content_type='text/html')
+    response.etag = 'abc'
+    assert p.compress(response, 'gzip')
+    assert gzip.decompress(response.body) == b'x' * 1000
+    assert response.content_encoding == 'gzip'
+    assert response.etag == 'abc-gzip'
+    assert response.vary == ('Accept-Encoding',)
+
+    response = webob.Response(b'x' * 1000, content_type='text/html')
+    assert p.compress(response, 'deflate')
+    assert zlib.decompress(response.body) == b'x' * 1000
+
+    response = webob.Response(b'x' * 10, content_type='text/html')
+    assert not p.compress(response, 'gzip')
+    assert response.body == b'x' * 10
+    assert response.vary == ('Accept-Encoding',)
+
+    response = webob.Response(b'x' * 1000, content_type='image/png')
+    assert not p.compress(response, 'gzip')
+    assert response.vary is None
+
+    response = webob.Response(b'x' * 1000, content_type='text/html')
+    assert not p.compress(response, None)
+    assert response.body == b'x' * 1000
+    assert response.vary == ('Accept-Encoding',)
+
+
+def test_compress_stream():
+    p = create_presentation(min_size=100)
+
+    response = webob.Response(app_iter=iter([b'hello', b' ', b'world']), content_type='text/html')
+    assert not p.compress(response, 'gzip')
+    assert response.content_encoding == 'gzip'
+    assert gzip.decompress(b''.join(response.app_iter)) == b'hello world'
+
+
+def test_compress_stream_skeleton():
+    class App:
+        def create_renderer(self, **params):
+            return html5_base.Renderer(static_url='/static')
+
+        def render_skeleton(self, h):
+            return h.html(lang='en')
+
+    class Chain:
+        def next(self, renderer, response, **params):
+            renderer << renderer.p('hello')
+            return response
+
+    p = presentation.PresentationService(
+        None, None, False, streaming=True, skeleton=True, compression={'activated': True, 'min_size': 100}
+    )
+    request = webob.Request.blank('/a', headers={'Accept-Encoding': 'gzip'})
+    response = p.handle_request(Chain(), App(), request, webob.Response())
+
+    assert response.content_encoding == 'gzip'
+    page = gzip.decompress(b''.join(response.app_iter))
+    assert page.startswith(b'<!DOCTYPE html>\n<html lang="en"><head>')
+    assert page.endswith(b'<body><p>hello</p></body></html>')
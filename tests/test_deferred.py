@@ -0,0 +1,250 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import time
+import types
+import asyncio
+import threading
+
+import webob
+import pytest
+from lxml import etree
+
+from nagare.server import mvc_deferred
+from nagare.renderers import html5_base
+from nagare.services import presentation
+
+
+def create_fragments(timeout=None):
+    return mvc_deferred.DeferredFragments(lambda: None, mvc_deferred.create_executor(4), timeout)
+
+
+def builder(tag, delay=0.2):
+    def build(h):
+        time.sleep(delay)
+        e = etree.Element(tag)
+        e.text = threading.current_thread().name
+        return [e, tag]
+
+    return build
+
+
+def test_graft():
+    page = etree.Element('body')
+    page.text = 'a'
+    page.append(etree.ProcessingInstruction(mvc_deferred.PLACEHOLDER_TARGET, '0'))
+    page[0].tail = 'b'
+    mvc_deferred.graft(page[0], ['c', etree.Element('p'), 'd'])
+    assert etree.tostring(page) == b'<body>ac<p/>db</body>'
+
+    mvc_deferred.graft(page[0], None)
+    assert etree.tostring(page) == b'<body>acdb</body>'
+
+
+def test_assemble():
+    fragments = create_fragments()
+
+    page = etree.Element('body')
+    page.extend([fragments.render(builder('nav')), fragments.render(builder('footer'))])
+
+    started = time.perf_counter()
+    assert fragments.assemble(page) is page
+    assert time.perf_counter() - started < 0.35
+
+    assert [e.tag for e in page] == ['nav', 'footer']
+    assert page[0].text.startswith('nagare-deferred') and (page[0].tail == 'nav')
+    assert not fragments.fragments
+
+
+def test_timeout():
+    fragments = create_fragments(0.1)
+
+    page = etree.Element('body')
+    page.extend([fragments.render(builder('nav', 0)), fragments.render(builder('footer', 1), 'footer')])
+    fragments.assemble(page)
+
+    assert etree.tostring(page).startswith(b'<body><nav>')
+    assert etree.tostring(page).endswith(b'</nav>navfooter</body>')
+
+
+def test_async():
+    async def build(h):
+        await asyncio.sleep(0.2)
+        return etree.Element('aside')
+
+    async def render():
+        fragments = create_fragments()
+
+        page = etree.Element('body')
+        page.extend([fragments.render(build), fragments.render(builder('nav')), fragments.render(build)])
+        assert fragments.is_async
+
+        started = time.perf_counter()
+        await fragments.assemble_async(page)
+        assert time.perf_counter() - started < 0.35
+
+        return page
+
+    assert [e.tag for e in asyncio.run(render())] == ['aside', 'nav', 'aside']
+
+
+def test_top_level():
+    fragments = create_fragments()
+
+    page = [etree.Element('p'), fragments.render(builder('nav', 0)), 'a']
+    page = fragments.assemble(page)
+    assert [node if isinstance(node, str) else node.tag for node in page] == ['p', 'nav', 'nav', 'a']
+
+    fragments = create_fragments()
+
+    page = fragments.assemble(fragments.render(builder('nav', 0)))
+    assert [node if isinstance(node, str) else node.tag for node in page] == ['nav', 'nav']
+
+
+def test_failure(caplog):
+    def fail(h):
+        raise ValueError('no nav')
+
+    fragments = create_fragments()
+
+    page = etree.Element('body')
+    page.extend([fragments.render(fail, 'nav'), fragments.render(builder('footer', 0))])
+    fragments.assemble(page)
+
+    assert etree.tostring(page).startswith(b'<body>nav<footer>')
+    assert 'deferred fragment 0 failed' in caplog.text
+
+    fragments = create_fragments()
+    fragments.render(fail, 'nav')
+    fragments.render(builder('footer', 0))
+
+    chunks = list(fragments.stream(lambda nodes, encoding: b''))
+    assert chunks == [b'<template id="nagare-deferred-content-1"></template><script>nagareSwap(1)</script>']
+
+
+def test_stream():
+    fragments = create_fragments(0.5)
+    h = types.SimpleNamespace(template=lambda **attrib: etree.Element('template', **attrib))
+
+    page = etree.Element('body')
+    page.extend([fragments.render(builder('nav', 0.2), 'loading'), fragments.render(builder('footer', 0))])
+    page.append(fragments.render(builder('aside', 1), etree.Element('hr')))
+    fragments.set_markers(h, page)
+    assert etree.tostring(page) == (
+        b'<body><template id="nagare-deferred-0"/>loading<!--/nagare-deferred-->'
+        b'<template id="nagare-deferred-1"/><!--/nagare-deferred-->'
+        b'<template id="nagare-deferred-2"/><hr/><!--/nagare-deferred--></body>'
+    )
+
+    def serialize(nodes, encoding):
+        return b''.join(
+            etree.tostring(node, encoding=encoding, with_tail=False) for node in nodes if not isinstance(node, str)
+        )
+
+    chunks = list(fragments.stream(serialize))
+    assert len(chunks) == 2
+    assert chunks[0].startswith(b'<template id="nagare-deferred-content-1"><footer>')
+    assert chunks[0].endswith(b'</footer></template><script>nagareSwap(1)</script>')
+    assert chunks[1].startswith(b'<template id="nagare-deferred-content-0"><nav>')
+
+
+class App:
+    def create_renderer(self, **params):
+        return html5_base.Renderer()
+
+
+class Chain:
+    def __init__(self, view):
+        self.view = view
+
+    def next(self, renderer, response, **params):
+        self.view(renderer)
+        return response
+
+
+def build_nav(h):
+    h.head << h.head.link(rel='stylesheet', href='/nav.css')
+    h.head.javascript_url('/nav.js')
+    return h.nav('menu')
+
+
+def test_presentation_assemble():
+    def view(h):
+        h.head << h.head.link(rel='stylesheet', href='/nav.css')
+        h << h.html(h.body(h.deferred.render(build_nav), h.p('content')))
+
+    p = presentation.PresentationService(None, None, deferred={'activated': True})
+    response = p.handle_request(Chain(view), App(), webob.Request.blank('/a'), webob.Response())
+
+    assert b'<body><nav>menu</nav><p>content</p>' in response.body
+    assert response.body.count(b'/nav.css') == 1
+    assert response.body.index(b'/nav.css') < response.body.index(b'<body>')
+    assert response.body.index(b'/nav.js') > response.body.index(b'<p>content</p>')
+
+
+def test_presentation_coroutine_builder():
+    async def build(h):
+        return h.nav('menu')
+
+    def view(h):
+        h << h.html(h.body(h.deferred.render(build)))
+
+    p = presentation.PresentationService(None, None, deferred={'activated': True})
+    with pytest.raises(RuntimeError, match='asynchronous view'):
+        p.handle_request(Chain(view), App(), webob.Request.blank('/a'), webob.Response())
+
+
+class SkeletonApp(App):
+    def render_skeleton(self, h):
+        return h.html(lang='en')
+
+
+def render_out_of_order(app, builder=build_nav, timeout=0):
+    def view(h):
+        h.head << h.head.link(rel='stylesheet', href='/page.css')
+        h << [h.p('content'), h.deferred.render(builder, 'loading')]
+
+    p = presentation.PresentationService(
+        None,
+        None,
+        False,
+        streaming=True,
+        skeleton=True,
+        deferred={'activated': True, 'out_of_order': True, 'timeout': timeout},
+    )
+    response = p.handle_request(Chain(view), app, webob.Request.blank('/a'), webob.Response())
+
+    return list(response.app_iter)
+
+
+def test_presentation_out_of_order():
+    for app in (App(), SkeletonApp()):
+        page = b''.join(render_out_of_order(app))
+        assert (b'<html lang="en">' in page) is isinstance(app, SkeletonApp)
+
+        assert b'<p>content</p><template id="nagare-deferred-0"></template>loading<!--/nagare-deferred-->' in page
+        assert page.index(b'function nagareSwap(n)') < page.index(b'<template id="nagare-deferred-content-0">')
+        assert page.endswith(b'<script>nagareSwap(0)</script></body></html>')
+
+        template = page[page.index(b'<template id="nagare-deferred-content-0">') :]
+        assert template.index(b'/nav.css') < template.index(b'/nav.js') < template.index(b'<nav>menu</nav>')
+        assert page.count(b'/page.css') == 1
+
+
+def test_presentation_out_of_order_timeout():
+    def build_late_nav(h):
+        time.sleep(0.5)
+        return h.nav('menu')
+
+    for app in (App(), SkeletonApp()):
+        page = b''.join(render_out_of_order(app, build_late_nav, 0.1))
+
+        assert b'<template id="nagare-deferred-0"></template>loading<!--/nagare-deferred-->' in page
+        assert b'nagare-deferred-content-0' not in page
+        assert page.endswith(b'</body></html>')
@@ -0,0 +1,108 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import webob
+
+from nagare.renderers import html5_base
+from nagare.services import presentation
+
+
+class App:
+    def __init__(self, version):
+        self.version = version
+
+    def get_version_key(self, request, **params):
+        return self.version
+
+    def create_renderer(self, **params):
+        return html5_base.Renderer()
+
+
+class Chain:
+    def __init__(self):
+        self.calls = 0
+
+    def next(self, response, **params):
+        self.calls += 1
+        response.text = 'hello' * 100
+        return response
+
+
+def handle(p, app, chain, **headers):
+    return p.handle_request(chain, app, webob.Request.blank('/a', headers=headers), webob.Response())
+
+
+def test_etag():
+    p = presentation.PresentationService(None, None, False, etag=True)
+
+    assert p.create_etag(b'hello') == p.create_etag(b'hello')
+    assert p.create_etag(b'hello') != p.create_etag(b'world')
+
+
+def test_version_etag():
+    p = presentation.PresentationService(None, None, False, etag=True)
+    request = webob.Request.blank('/')
+
+    assert p.get_version_etag(object(), request) is None
+    assert p.get_version_etag(App(None), request) is None
+    assert p.get_version_etag(App(42), request) == p.create_etag(b'42')
+
+
+def test_not_modified():
+    p = presentation.PresentationService(None, None, False, etag=True)
+
+    response = p.set_not_modified(webob.Response(b'hello'), 'abc')
+    assert response.status_code == 304
+    assert response.body == b''
+    assert response.content_length is None
+    assert response.etag == 'abc'
+
+
+def test_version_not_modified():
+    p = presentation.PresentationService(None, None, False, etag=True)
+    app, chain = App(42), Chain()
+
+    response = handle(p, app, chain)
+    etag = response.etag
+    assert (response.status_code, etag, chain.calls) == (200, p.create_etag(b'42'), 1)
+
+    response = handle(p, app, chain, **{'If-None-Match': '"{}"'.format(etag)})
+    assert (response.status_code, response.etag, response.body, chain.calls) == (304, etag, b'', 1)
+
+    response = handle(p, app, chain, **{'If-None-Match': '"other"'})
+    assert (response.status_code, chain.calls) == (200, 2)
+
+
+def test_rendered_not_modified():
+    p = presentation.PresentationService(None, None, False, etag=True)
+    app, chain = App(None), Chain()
+
+    response = handle(p, app, chain)
+    etag = response.etag
+    assert etag == p.create_etag(b'hello' * 100)
+
+    response = handle(p, app, chain, **{'If-None-Match': '"{}"'.format(etag)})
+    assert (response.status_code, response.etag, response.body, chain.calls) == (304, etag, b'', 2)
+
+
+def test_not_modified_vary():
+    p = presentation.PresentationService(None, None, False, etag=True, compression={'activated': True, 'min_size': 100})
+    app, chain = App(42), Chain()
+
+    response = handle(p, app, chain, **{'Accept-Encoding': 'gzip'})
+    etag = response.etag
+    assert etag == p.create_etag(b'42') + '-gzip'
+    assert (response.content_encoding, response.vary) == ('gzip', ('Accept-Encoding',))
+
+    response = handle(p, app, chain, **{'Accept-Encoding': 'gzip', 'If-None-Match': '"{}"'.format(etag)})
+    assert (response.status_code, response.etag, response.vary, chain.calls) == (304, etag, ('Accept-Encoding',), 1)
+
+    # The compressed variant doesn't match a request without compression
+    response = handle(p, app, chain, **{'If-None-Match': '"{}"'.format(etag)})
+    assert (response.status_code, response.content_encoding, response.etag, chain.calls) == (200, None, etag[:-5], 2)
@@ -0,0 +1,79 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+from lxml import etree
+
+from nagare.server import mvc_cache, mvc_fragments
+
+
+def serialize(output, encoding):
+    return etree.tostring(output, encoding=encoding, method='html')
+
+
+def create_fragments(cache):
+    return mvc_fragments.Fragments(None, cache, serialize)
+
+
+def test_cache():
+    cache = mvc_cache.MemoryCache()
+    calls = []
+
+    def builder(h):
+        calls.append(h)
+        e = etree.Element('nav')
+        e.text = 'été'
+        return e
+
+    fragments = create_fragments(cache)
+    placeholder = fragments.render('nav', builder)
+    assert etree.tostring(placeholder) == '<?nagare-fragment {} 0?>'.format(fragments.token).encode('ascii')
+    assert fragments.fragments == [b'<nav>\xc3\xa9t\xc3\xa9</nav>']
+
+    fragments = create_fragments(cache)
+    fragments.render('nav', builder)
+    assert fragments.fragments == [b'<nav>\xc3\xa9t\xc3\xa9</nav>']
+    assert len(calls) == 1
+
+
+def test_splice():
+    fragments = create_fragments(mvc_cache.MemoryCache())
+
+    page = etree.Element('body')
+    page.append(fragments.render('nav', lambda h: etree.Element('nav')))
+    page.append(etree.Element('p'))
+    page.append(fragments.render('footer', lambda h: etree.Element('footer', id='été')))
+
+    output = etree.tostring(page, method='html', encoding='utf-8')
+    assert fragments.splice(output) == b'<body><nav></nav><p></p><footer id="\xc3\xa9t\xc3\xa9"></footer></body>'
+
+    output = etree.tostring(page, method='xml', encoding='iso-8859-1')
+    assert fragments.splice(output, 'iso-8859-1').endswith(
+        b'<body><nav></nav><p/><footer id="\xe9t\xe9"></footer></body>'
+    )
+
+    assert create_fragments(None).splice(output) is output
+
+
+def test_forged_placeholders():
+    fragments = create_fragments(mvc_cache.MemoryCache())
+
+    page = etree.Element('body')
+    page.append(fragments.render('nav', lambda h: etree.Element('nav')))
+    page.append(etree.ProcessingInstruction(mvc_fragments.PLACEHOLDER_TARGET, '0'))
+    page.append(etree.ProcessingInstruction(mvc_fragments.PLACEHOLDER_TARGET, '{} 0'.format('0' * 16)))
+    page.append(etree.ProcessingInstruction(mvc_fragments.PLACEHOLDER_TARGET, '{} 1'.format(fragments.token)))
+
+    output = etree.tostring(page, method='html', encoding='utf-8')
+    assert fragments.splice(output) == (
+        b'<body><nav></nav><?nagare-fragment 0>'
+        b'<?nagare-fragment 0000000000000000 0>'
+        + '<?nagare-fragment {} 1>'.format(fragments.token).encode('ascii')
+        + b'</body>'
+    )
+    assert create_fragments(None).token != fragments.token
@@ -0,0 +1,101 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import webob
+from lxml import etree
+
+from nagare.server import mvc_hints
+from nagare.renderers import html5_base
+from nagare.services import presentation
+
+HEAD = etree.fromstring(
+    '<head>'
+    '<link rel="stylesheet" href="/a.css"/><link rel="icon" href="/a.ico"/>'
+    '<script src="/a.js"></script><script>inline()</script><script type="module" src="/m.js"></script>'
+    '</head>'
+)
+
+
+class App:
+    def get_preload_key(self, request, **params):
+        return 'view'
+
+
+def test_preload_links():
+    bottom = ['text', etree.fromstring('<script src="/b.js"></script>'), etree.fromstring('<script src="/a.js"/>')]
+
+    assert mvc_hints.create_preload_links([HEAD, *bottom]) == (
+        '</a.css>; rel=preload; as=style',
+        '</a.js>; rel=preload; as=script',
+        '</m.js>; rel=modulepreload',
+        '</b.js>; rel=preload; as=script',
+    )
+
+    head = etree.fromstring(
+        '<head><link rel="stylesheet" href="/été.css?v=1&amp;x=%C3%A9"/><script src="/€.js"/></head>'
+    )
+    assert mvc_hints.create_preload_links([head]) == (
+        '</%C3%A9t%C3%A9.css?v=1&x=%C3%A9>; rel=preload; as=style',
+        '</%E2%82%AC.js>; rel=preload; as=script',
+    )
+
+
+def test_early_hints():
+    p = presentation.PresentationService(None, None, False, preload={'activated': True})
+    app = App()
+    sent = []
+
+    request = webob.Request.blank('/a', environ={'nagare.early_hints': sent.append})
+    p.send_early_hints(app, request)
+    assert sent == []
+
+    response = webob.Response()
+    p.set_preload_links(request, response, HEAD, [])
+    assert response.headers['Link'].startswith('</a.css>; rel=preload; as=style, </a.js>')
+
+    request = webob.Request.blank('/b', environ={'nagare.early_hints': sent.append})
+    p.send_early_hints(app, request)
+    assert sent == [
+        ('</a.css>; rel=preload; as=style', '</a.js>; rel=preload; as=script', '</m.js>; rel=modulepreload')
+    ]
+
+    response = webob.Response()
+    p.set_preload_links(request, response, etree.Element('head'), [])
+    assert response.headers['Link'] == ', '.join(sent[0])
+
+    assert p.get_early_hints(app, webob.Request.blank('/c')) == sent[0]
+
+
+def test_skeleton_preload_links():
+    class SkeletonApp(App):
+        def create_renderer(self, **params):
+            return html5_base.Renderer()
+
+        def render_skeleton(self, h):
+            h.head << h.head.link(rel='stylesheet', href='/skeleton.css')
+            h.head.javascript_url('/skeleton.js')
+            return h.html(lang='en')
+
+    class Chain:
+        def next(self, renderer, response, **params):
+            renderer.head.javascript_url('/page.js')
+            renderer << renderer.p('hello')
+            return response
+
+    for streaming in (False, True):
+        p = presentation.PresentationService(
+            None, None, False, streaming=streaming, skeleton=True, preload={'activated': True}
+        )
+        app = SkeletonApp()
+        response = p.handle_request(Chain(), app, webob.Request.blank('/a'), webob.Response())
+
+        links = ('</skeleton.css>; rel=preload; as=style', '</page.js>; rel=preload; as=script')
+        links += ('</skeleton.js>; rel=preload; as=script',)
+        assert response.headers['Link'] == ', '.join(links)
+        assert p.get_early_hints(app, webob.Request.blank('/b')) == links
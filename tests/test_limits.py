@@ -0,0 +1,51 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import pytest
+from lxml import etree
+from webob import exc
+
+from nagare.services import presentation
+
+
+def create_page(size):
+    page = etree.Element('html')
+    body = etree.SubElement(page, 'body')
+    for i in range(size):
+        etree.SubElement(body, 'p').text = str(i)
+
+    return page
+
+
+def test_elements():
+    p = presentation.PresentationService(None, None, False, limits={'stream_elements': 10, 'max_elements': 100})
+
+    assert not p.check_elements(create_page(7))
+    assert p.check_elements(create_page(8)[:] + [etree.Element('p')] * 2)
+    assert p.check_elements(create_page(98))
+    assert not p.check_elements('text' * 1000)
+
+    with pytest.raises(exc.HTTPInternalServerError):
+        p.check_elements(create_page(99))
+
+    p = presentation.PresentationService(None, None, False, streaming=True)
+    assert p.check_elements(create_page(1000))
+
+
+def test_size():
+    p = presentation.PresentationService(None, None, False, limits={'max_size': 10})
+
+    assert p.check_size(b'x' * 10) == b'x' * 10
+    with pytest.raises(exc.HTTPInternalServerError):
+        p.check_size(b'x' * 11)
+
+    chunks = p.limit_chunks(iter([b'x' * 4, b'x' * 4, b'x' * 4]))
+    assert next(chunks) == next(chunks) == b'x' * 4
+    with pytest.raises(exc.HTTPInternalServerError):
+        next(chunks)
@@ -662,3 +662,84 @@ def test_canonical():
         merge_head(p, r, h) == b'<html><head><link rel="canonical" href="/bar"></head><body></body></html>'
         or merge_head(p, r, h) == b'<html><head><link href="/bar" rel="canonical"></head><body></body></html>'
     )
+
+
+def test_canonical_url():
+    p = create_presentation(True)
+
+    assert p.get_canonical_url(create_request('', '')) == ''
+    assert p.get_canonical_url(create_request('/foo/', '')) == '/foo'
+    assert p.get_canonical_url(create_request('', '/bar')) == '/bar'
+    assert p.get_canonical_url(create_request('/foo', '/bar')) == '/bar/foo'
+
+    r = create_request('/foo', '/bar')
+    assert p.get_canonical_url(r) == '/bar/foo'
+    r.path_info = '/baz'
+    assert p.get_canonical_url(r) == '/bar/foo'
+
+
+class SkeletonApp:
+    def create_renderer(self, **params):
+        return html.Renderer()
+
+    def render_skeleton(self, h):
+        h.head << h.head.title('hello')
+        return h.html(lang='en')
+
+
+def test_skeleton():
+    app = SkeletonApp()
+    p = presentation.PresentationService(None, None, False, skeleton=True)
+
+    assert p.create_skeleton(object(), 'utf-8', '<!DOCTYPE html>') is None
+    assert p.create_skeleton(app, 'utf-8', '<!DOCTYPE html>') == [
+        b'<!DOCTYPE html>\n<html lang="en"><head><title>hello</title>',
+        b'</head><body>',
+        b'</body></html>',
+    ]
+
+    r = create_request('/a', '/b')
+    h = app.create_renderer()
+    h.head << h.head.meta(name='x')
+    h << h.p('world') << '!'
+
+    body, chunks = p.serialize_with_skeleton(
+        app, r, h, h.head.render_top(), h.head.render_bottom(), h.root, 'utf-8', '<!DOCTYPE html>'
+    )
+    assert b''.join(chunks) == (
+        b'<!DOCTYPE html>\n<html lang="en"><head><title>hello</title><meta name="x"></head>'
+        b'<body><p>world</p>!</body></html>'
+    )
+
+    h = app.create_renderer()
+    h << h.body(h.p('world'))
+
+    body, chunks = p.serialize_with_skeleton(
+        app, r, h, h.head.render_top(), h.head.render_bottom(), h.root, 'utf-8', '<!DOCTYPE html>'
+    )
+    assert chunks is None
+    assert merge_head(p, r, h) == b'<html><head></head><body><p>world</p></body></html>'
+
+
+def test_skeleton_fallback():
+    app = SkeletonApp()
+    p = presentation.PresentationService(None, None, False, skeleton=True)
+    r = create_request('/a', '/b')
+
+    def merge_head(h):
+        skeleton = p.get_skeleton_parts(app)
+        return p.merge_head(r, h, h.head.render_top(), h.head.render_bottom(), h.root, skeleton).tostring()
+
+    h = app.create_renderer()
+    h.head << h.head.meta(name='x')
+    h << h.body(h.p('world'))
+    assert (
+        merge_head(h)
+        == b'<html lang="en"><head><title>hello</title><meta name="x"></head><body><p>world</p></body></html>'
+    )
+
+    h = app.create_renderer()
+    h << h.html(h.body(h.p('world')), lang='fr')
+    assert merge_head(h) == b'<html lang="fr"><head><title>hello</title></head><body><p>world</p></body></html>'
+
+    assert p.get_skeleton_parts(object()) is None
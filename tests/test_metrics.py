@@ -0,0 +1,94 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import re
+import tracemalloc
+
+import pytest
+
+from nagare.server import mvc_metrics
+
+
+def test_timings():
+    timings = mvc_metrics.Timings()
+    timings.mark('view')
+    timings.mark('serialize', 100)
+
+    assert [(stage, size) for stage, _, size in timings.stages] == [('view', None), ('serialize', 100)]
+    assert timings.total == pytest.approx(sum(duration for _, duration, _ in timings.stages))
+    assert re.match(
+        r'view;dur=\d+\.\d{3}, serialize;dur=\d+\.\d{3};desc="100B", total;dur=\d+\.\d{3}$', timings.to_header()
+    )
+
+
+def test_null_timings():
+    mvc_metrics.NULL_TIMINGS.mark('view')
+    assert mvc_metrics.NULL_TIMINGS.stages == ()
+
+
+def test_histogram():
+    histogram = mvc_metrics.Histogram(1, 10)
+    for i in range(1, 101):
+        histogram.add(i)
+
+    assert histogram.to_dict() == {'count': 100, 'mean': 50.5, 'p50': 64, 'p90': 100, 'p99': 100, 'max': 100}
+
+    histogram = mvc_metrics.Histogram(1, 10)
+    assert histogram.to_dict() == {'count': 0, 'mean': 0, 'p50': 0, 'p90': 0, 'p99': 0, 'max': 0}
+
+
+def test_metrics():
+    metrics = mvc_metrics.Metrics()
+
+    for size in (100, 200):
+        timings = mvc_metrics.Timings()
+        timings.mark('view')
+        timings.mark('serialize', size)
+        metrics(None, None, timings)
+
+    report = metrics.report()
+    assert sorted(report['durations']) == ['serialize', 'total', 'view']
+    assert report['durations']['view']['count'] == 2
+    assert report['sizes'] == {'serialize': {'count': 2, 'mean': 150, 'p50': 128, 'p90': 200, 'p99': 200, 'max': 200}}
+
+
+def test_memory_timings():
+    timings = mvc_metrics.MemoryTimings()
+    data = [bytearray(1024) for _ in range(100)]
+    timings.mark('view')
+    del data
+    timings.mark('serialize')
+    timings.stop()
+
+    assert timings.memory >= 100 * 1024
+    assert re.search(r', memory;desc="\d+B", total;dur=', timings.to_header())
+
+    metrics = mvc_metrics.Metrics()
+    metrics(None, None, timings)
+    assert metrics.report()['sizes']['memory']['count'] == 1
+
+
+def test_memory_tracing():
+    assert not tracemalloc.is_tracing()
+
+    timings1 = mvc_metrics.MemoryTimings()
+    timings2 = mvc_metrics.MemoryTimings()
+    timings1.stop()
+    assert tracemalloc.is_tracing()
+
+    timings2.stop()
+    timings2.stop()
+    assert not tracemalloc.is_tracing()
+
+    tracemalloc.start()
+    try:
+        mvc_metrics.MemoryTimings().stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,115 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import time
+import asyncio
+import threading
+
+import webob
+from lxml import etree
+
+from nagare.renderers import html5_base
+from nagare.services import presentation
+from nagare.server import mvc_metrics, mvc_offload
+
+
+def test_count_reaches():
+    root = etree.fromstring('<html><body><p>a</p><p>b</p></body></html>')
+
+    assert mvc_offload.count_reaches(root, 4)
+    assert not mvc_offload.count_reaches(root, 5)
+    assert mvc_offload.count_reaches([root, root[0]], 7)
+    assert not mvc_offload.count_reaches(['text', root[0][0]], 2)
+
+
+def test_run():
+    offloader = mvc_offload.Offloader(max_workers=2)
+    timings = mvc_metrics.Timings()
+
+    assert offloader.run(timings, threading.current_thread) is not threading.current_thread()
+    assert [stage for stage, _, _ in timings.stages] == ['offload_wait']
+
+    assert asyncio.run(offloader.run_async(mvc_metrics.NULL_TIMINGS, sum, [1, 2])) == 3
+
+    report = offloader.report()
+    assert (report['submitted'], report['pending'], report['blocked']) == (2, 0, 0)
+
+    offloader.shutdown()
+
+
+def test_cancelled_while_blocked():
+    offloader = mvc_offload.Offloader(max_workers=1, max_pending=0)
+
+    async def run():
+        busy = asyncio.ensure_future(offloader.run_async(mvc_metrics.NULL_TIMINGS, time.sleep, 0.1))
+        await asyncio.sleep(0.01)
+
+        blocked = asyncio.ensure_future(offloader.run_async(mvc_metrics.NULL_TIMINGS, sum, [1, 2]))
+        await asyncio.sleep(0.01)
+        blocked.cancel()
+
+        await busy
+        await asyncio.sleep(0.05)
+
+        return await asyncio.wait_for(offloader.run_async(mvc_metrics.NULL_TIMINGS, sum, [1, 2]), 0.5)
+
+    assert asyncio.run(run()) == 3
+    assert offloader.report()['blocked'] == 1
+
+    offloader.shutdown()
+
+
+def test_backpressure():
+    offloader = mvc_offload.Offloader(max_workers=1, max_pending=1)
+
+    threads = [
+        threading.Thread(target=offloader.run, args=(mvc_metrics.NULL_TIMINGS, time.sleep, 0.05)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    report = offloader.report()
+    assert report['submitted'] == 4
+    assert report['max_pending'] == 2
+    assert report['blocked'] >= 1
+
+    offloader.shutdown()
+
+
+class App:
+    def create_renderer(self, **params):
+        return html5_base.Renderer()
+
+
+class Chain:
+    def next(self, response, **params):
+        return response
+
+
+def test_presentation_async_only():
+    def render(h):
+        return h.ul([h.li(str(i)) for i in range(10)])
+
+    async def render_async(h):
+        return render(h)
+
+    p = presentation.PresentationService(None, None, False, offload={'activated': True, 'min_elements': 10})
+
+    response = p.handle_request(Chain(), App(), webob.Request.blank('/a'), webob.Response(), render)
+    assert b'<li>9</li></ul>' in response.body
+    assert p.offload.report()['submitted'] == 0  # A synchronous request serializes its page itself
+
+    response = asyncio.run(p.handle_request(Chain(), App(), webob.Request.blank('/a'), webob.Response(), render_async))
+    assert b'<li>9</li></ul>' in response.body
+    assert p.offload.report()['submitted'] == 1
+
+    p.offload.shutdown()
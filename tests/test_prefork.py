@@ -0,0 +1,96 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import ast
+import sys
+import time
+import subprocess  # noqa: S404
+import http.client
+
+import webob
+from webob import exc
+
+from nagare.server import mvc_prefork
+
+SERVER = """
+import os
+
+from nagare.server import mvc_prefork
+
+warm = []
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str((os.getpid(), os.getppid(), len(warm))).encode()]
+
+
+def warmup():
+    warm.append(os.getpid())
+    print(server.address[1], flush=True)
+
+
+server = mvc_prefork.PreforkServer(app, port=0, nb_workers=2, warmup=warmup)
+server.serve()
+"""
+
+FAILING_SERVER = """
+from nagare.server import mvc_prefork
+
+
+class Server(mvc_prefork.PreforkServer):
+    def serve_worker(self):
+        raise OSError('no worker')
+
+
+Server(None, port=0, nb_workers=2, restart_interval=0.2, max_failures=3).serve()
+"""
+
+
+def test_wsgi_app():
+    def handle(request, response):
+        if request.path_info == '/redirect':
+            raise exc.HTTPFound(location='/')
+
+        response.text = request.path_info
+        return response
+
+    app = mvc_prefork.create_wsgi_app(handle)
+
+    response = webob.Request.blank('/hello').get_response(app)
+    assert response.body == b'/hello'
+
+    response = webob.Request.blank('/redirect').get_response(app)
+    assert response.status_code == 302
+
+
+def test_prefork():
+    master = subprocess.Popen([sys.executable, '-c', SERVER], stdout=subprocess.PIPE, text=True)  # noqa: S603
+    try:
+        port = int(master.stdout.readline())
+
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', '/')
+        pid, ppid, warm = ast.literal_eval(connection.getresponse().read().decode())
+        connection.close()
+
+        assert (ppid, warm) == (master.pid, 1)
+        assert pid != master.pid
+    finally:
+        master.terminate()
+        assert master.wait(5) == 0
+
+
+def test_prefork_failures():
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', FAILING_SERVER], capture_output=True, text=True, timeout=10)  # noqa: S603
+
+    assert result.returncode == 1
+    assert 'RuntimeError: 3 workers in a row died at startup' in result.stderr
+    assert time.perf_counter() - started > 0.2  # The workers were not restarted right away
@@ -0,0 +1,169 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import threading
+
+import webob
+
+from nagare.renderers import html5_base
+from nagare.services import presentation
+from nagare.server import mvc_application
+
+
+def test_reuse():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+
+    h1 = pool.acquire(static_url='/static')
+    pool.release(h1)
+    h2 = pool.acquire(static_url='/static')
+    h3 = pool.acquire(static_url='/static')
+
+    assert h2 is h1
+    assert h3 is not h1
+
+
+def test_size():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+
+    h1 = pool.acquire()
+    h2 = pool.acquire()
+    pool.release(h1)
+    pool.release(h2)
+
+    assert pool.acquire() is h1
+    assert pool.acquire() is not h2
+
+
+def test_no_leak():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+
+    h = pool.acquire(static_url='/static')
+    h.head << h.head.title('hello')
+    h.head.javascript_url('/foo.js')
+    h << h.p('world')
+    h.foo = 'bar'
+    pool.release(h)
+
+    h = pool.acquire(static_url='/static')
+    fresh = html5_base.Renderer(static_url='/static')
+
+    assert h.root == fresh.root == []
+    assert len(h.head.render_top()) == len(fresh.head.render_top()) == 0
+    assert list(h.head.render_bottom()) == list(fresh.head.render_bottom()) == []
+    assert not hasattr(h, 'foo')
+
+
+def test_per_thread():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+    pool.release(pool.acquire())
+
+    renderers = []
+    thread = threading.Thread(target=lambda: renderers.append(pool.acquire()))
+    thread.start()
+    thread.join()
+
+    assert len(pool.renderers) == 1
+    assert renderers[0] is not pool.renderers[0]
+
+
+def test_release_on_acquiring_thread():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+    h = pool.acquire()
+
+    thread = threading.Thread(target=pool.release, args=(h,))
+    thread.start()
+    thread.join()
+
+    assert pool.acquire() is h
+
+
+def test_reset_per_request_state():
+    pool = mvc_application.RendererPool(html5_base.Renderer, 1)
+
+    h = pool.acquire(static_url='/static')
+    h.shared = object()
+    h.head.javascript_url('/foo.js')
+    pool.release(h)
+
+    assert pool.acquire(static_url='/other') is h
+    assert 'shared' not in vars(h)
+    assert list(h.head.render_bottom()) == []
+
+
+def test_reset_nested_state():
+    class Renderer(html5_base.Renderer):
+        def __init__(self, **params):
+            super().__init__(**params)
+            self.state = {'ids': []}
+
+    pool = mvc_application.RendererPool(Renderer, 1)
+
+    h = pool.acquire()
+    h.state['ids'].append('x')
+    pool.release(h)
+
+    assert pool.acquire() is h
+    assert h.state == {'ids': []}
+
+
+def test_reset_method():
+    class Renderer(html5_base.Renderer):
+        def reset(self, **params):
+            self.params = params
+
+    pool = mvc_application.RendererPool(Renderer, 1)
+    h = pool.acquire()
+    pool.release(h)
+
+    assert pool.acquire(static_url='/static') is h
+    assert h.params == {'static_url': '/static'}
+
+
+class App:
+    renderer_factory = html5_base.Renderer
+    xhr_renderer_factory = mvc_application.XHRRenderer
+    static_url = '/static'
+
+    create_renderer = mvc_application.App.create_renderer
+    create_xhr_renderer = mvc_application.App.create_xhr_renderer
+    release_renderer = mvc_application.App.release_renderer
+
+    def __init__(self):
+        self.renderers = mvc_application.RendererPool(self.renderer_factory, 2)
+
+
+class Chain:
+    def next(self, renderer, response, **params):
+        renderer.head << renderer.head.title('hello')
+        renderer << renderer.p('world')
+        return response
+
+
+def test_xhr_renderer_not_pooled():
+    app = App()
+    p = presentation.PresentationService(None, None, False, xhr_fast_path=True)
+
+    xhr = webob.Request.blank('/a', headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert p.handle_request(Chain(), app, xhr, webob.Response()).body == b'<p>world</p>'
+    assert not app.renderers.renderers
+
+    page = p.handle_request(Chain(), app, webob.Request.blank('/a'), webob.Response()).body
+    assert b'<title>hello</title>' in page
+    assert type(app.renderers.renderers[0]) is html5_base.Renderer
+
+
+def test_streamed_renderer_released():
+    app = App()
+    p = presentation.PresentationService(None, None, False, streaming=True)
+
+    response = p.handle_request(Chain(), app, webob.Request.blank('/a'), webob.Response())
+    assert not app.renderers.renderers
+
+    assert b'<title>hello</title>' in b''.join(response.app_iter)
+    assert len(app.renderers.renderers) == 1
@@ -7,8 +7,12 @@
 # this distribution.
 # --
 
+import json
+
+import webob
 from lxml import etree
 
+from nagare.server import mvc_metrics
 from nagare.services import presentation
 from nagare.renderers import xml
 from nagare.renderers import html_base as html
@@ -196,3 +200,83 @@ def test_list():
         r
         == b'<!DOCTYPE html>\n<person>hello</person><!--hello--><?hello ?><person>hello</person>hellohello<p>hello</p>'
     )
+
+
+def test_stream():
+    h = html.Renderer()
+    p = presentation.PresentationService(None, None, False, chunk_size=10)
+
+    page = h.html(h.head.head(h.head.title('hello')), h.body(h.p('hello'), h.p('world'), id='body'), lang='en')
+    chunks = list(p.stream(page, 'utf-8', '<!DOCTYPE html>'))
+    assert chunks == [
+        b'<!DOCTYPE html>\n<html lang="en"><head><title>hello</title></head>',
+        b'<body id="body"><p>hello</p>',
+        b'<p>world</p>',
+        b'</body></html>',
+    ]
+    assert b''.join(chunks) == p.serialize(page, 'utf-8', '<!DOCTYPE html>')
+
+    p = presentation.PresentationService(None, None, False)
+
+    page = h.html(h.comment('c1'), h.head.head, h.comment('c2'), h.body('hello'))
+    assert list(p.stream(page)) == [b'<html><!--c1--><head></head><!--c2-->', b'<body>hello</body></html>']
+
+    page = h.html(h.head.head, h.body(h.p('hello')))
+    assert list(p.stream(page, tail=iter([b'<p>late</p>']))) == [
+        b'<html><head></head>',
+        b'<body><p>hello</p>',
+        b'<p>late</p>',
+        b'</body></html>',
+    ]
+
+
+def test_nested_list():
+    h = html.Renderer()
+    p = presentation.PresentationService(None, None, False)
+
+    def producer():
+        yield h.p('world')
+        yield ('!', [h.br])
+
+    r = p.serialize(['hello', [h.div, (h.span, producer())], b'end'])
+    assert r == b'hello<div></div><span></span><p>world</p>!<br>end'
+
+    r = p.serialize(['hello', [h.div, (h.span, producer())]], 'utf-8', '<!DOCTYPE html>')
+    assert r == b'hello<div></div><span></span><p>world</p>!<br>'
+
+    r = p.serialize([h.div, [h.span, producer()]], 'utf-8', '<!DOCTYPE html>')
+    assert r == b'<!DOCTYPE html>\n<div></div><span></span><p>world</p>!<br>'
+
+
+def test_minify():
+    h = html.Renderer()
+    p = presentation.PresentationService(None, None, False)
+
+    page = h.div(
+        '\n  ', h.p('  hello\n   world '), '  ', h.pre('  a\n  b ', h.b(' x  '), '  y'), '\n ', h.comment(' c  c ')
+    )
+    r = p.serialize(p.minify_tree(page))
+    assert r == b'<div> <p> hello world </p> <pre>  a\n  b <b> x  </b>  y</pre> <!-- c  c --></div>'
+
+    page = [h.textarea(' a  b '), '  ', h.script('  var  x '), ' \n ', h.p('  c ')]
+    r = p.serialize(p.minify_tree(page))
+    assert r == b'<textarea> a  b </textarea> <script>  var  x </script> <p> c </p>'
+
+    r = p.serialize(p.minify_tree(x for x in ('  a ', [h.p(' b  '), ' \n c'])))
+    assert r == b' a <p> b </p> c'
+
+    r = p.serialize(p.minify_tree(h.p('1\xa0000  \xa0\xa0€ ')))
+    assert r == '<p>1\xa0000 \xa0\xa0€ </p>'.encode('utf-8')
+
+
+def test_xhr():
+    h = html.Renderer()
+    p = presentation.PresentationService(None, None, False, xhr_fast_path=True)
+
+    r = p.serialize_xhr(None, webob.Response(), h, [h.p('hello'), 'world'], mvc_metrics.NULL_TIMINGS)
+    assert r.content_type == 'text/html'
+    assert r.body == b'<p>hello</p>world'
+
+    r = p.serialize_xhr(None, webob.Response(), h, {'c1': h.p('été'), 'c2': [h.br, 'x']}, mvc_metrics.NULL_TIMINGS)
+    assert r.content_type == 'application/json'
+    assert json.loads(r.body) == {'c1': '<p>été</p>', 'c2': '<br>x'}
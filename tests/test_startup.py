@@ -0,0 +1,63 @@
+# --
+# Copyright (c) 2014-2026 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import os
+import sys
+import subprocess  # noqa: S404
+
+LAZY_MODULES = (
+    'asyncio',
+    'inspect',
+    'tempfile',
+    'webob.exc',
+    'tracemalloc',
+    'importlib.metadata',
+    'concurrent.futures',
+    'nagare.server.mvc_cache',
+    'nagare.server.mvc_deferred',
+)
+# µs, of the modules imported by the presentation service only: twice the 3.8 ms of the service without its options
+MAX_IMPORT_TIME = 8000
+DEPENDENCIES = 'import lxml.etree, webob, nagare.services.plugin'
+
+
+def import_times(statement):
+    """Import time, in µs, of each module imported by ``statement``, without the modules it imports."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # Else the modules are compiled again by each run
+
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True, check=True, env=env
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        self_time, _, module = line.split('|')
+        self_time = self_time.rsplit(':', 1)[-1].strip()
+        if self_time.isdigit():
+            times[module.strip()] = int(self_time)
+
+    return times
+
+
+def test_startup():
+    dependencies = import_times(DEPENDENCIES)
+
+    import_time = None
+    for _ in range(3):  # The fastest of the runs, the others being slowed down by the host
+        # The dependencies are imported first, else the reports of their imports count in the service time
+        times = import_times(DEPENDENCIES + '; import nagare.services.presentation')
+
+        imported = set(times) - set(dependencies)
+        assert not imported & set(LAZY_MODULES)
+
+        run_time = sum(times[module] for module in imported)
+        import_time = run_time if import_time is None else min(import_time, run_time)
+
+    assert import_time < MAX_IMPORT_TIME